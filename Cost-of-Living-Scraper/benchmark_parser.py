@@ -0,0 +1,89 @@
+import os
+import gzip
+import math
+import time
+import argparse
+from src.scraper.html_parser import HtmlParser
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark HtmlParser backends on a corpus of saved Numbeo pages.",
+        epilog="Examples:\n"
+               "  python benchmark_parser.py                              # Pages cached by main.py --cache\n"
+               "  python benchmark_parser.py --corpus pages/ --repeat 5   # Directory of .html/.html.gz files",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--corpus",
+        default=os.path.join("data", "page_cache"),
+        help="Directory of saved .html or .html.gz pages (default: data/page_cache)"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of passes over the corpus per backend (default: 3)"
+    )
+    return parser.parse_args()
+
+def load_corpus(corpus_dir):
+    """Read every saved page in a directory."""
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, name)
+        if name.endswith('.html.gz'):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                pages.append((name, f.read()))
+        elif name.endswith('.html'):
+            with open(path, encoding='utf-8') as f:
+                pages.append((name, f.read()))
+    return pages
+
+def normalize(result):
+    """Make parse results comparable by mapping NaN to None."""
+    def clean(value):
+        return None if isinstance(value, float) and math.isnan(value) else value
+
+    data, entries_count = result
+    if data is None:
+        return None, clean(entries_count)
+    return [{k: clean(v) for k, v in item.items()} for item in data], clean(entries_count)
+
+def time_backend(pages, backend, repeat):
+    """Return the best wall-clock time over several passes and the parsed results."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [HtmlParser.parse_cost_data(html, backend=backend) for _, html in pages]
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        print(f"Error: No .html or .html.gz pages found in {args.corpus}")
+        exit(1)
+    total_mb = sum(len(html) for _, html in pages) / 1024 ** 2
+    print(f"Corpus: {len(pages)} pages, {total_mb:.1f} MB")
+
+    timings = {}
+    outputs = {}
+    for backend in HtmlParser.BACKENDS:
+        try:
+            timings[backend], outputs[backend] = time_backend(pages, backend, args.repeat)
+        except ImportError as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        print(f"{backend:>5}: {timings[backend]:.3f}s ({len(pages) / timings[backend]:.0f} pages/s)")
+
+    if len(timings) == len(HtmlParser.BACKENDS):
+        reference = [normalize(result) for result in outputs['bs4']]
+        mismatches = [name for (name, _), expected, result in zip(pages, reference, outputs['lxml'])
+                      if normalize(result) != expected]
+        print(f"Speedup lxml vs bs4: {timings['bs4'] / timings['lxml']:.1f}x")
+        if mismatches:
+            print(f"Output mismatch on {len(mismatches)} pages: {', '.join(mismatches[:10])}")
+            exit(1)
+        print("Outputs identical across backends.")
@@ -1,5 +1,8 @@
 import argparse
 from src.scraper.scraper import CostOfLivingScraper
+from src.scraper.url_formatter import UrlFormatter
+from src.scraper.html_parser import HtmlParser
+from src.scraper.file_manager import FileManager
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -9,7 +12,12 @@ def parse_arguments():
                "  python main.py --all --range A-G                       # Countries A-G → batch_AG.parquet\n"
                "  python main.py --include United-States New-York        # Only US + NYC\n"
                "  python main.py --all --include Japan Tokyo             # All countries + Tokyo\n"
-               "  python main.py --include Canada Toronto Germany Berlin # Specific countries + cities",
+               "  python main.py --include Canada Toronto Germany Berlin # Specific countries + cities\n"
+               "  python main.py --all --concurrency 4 --rate 1          # 4 requests in flight, 1 request/s per host\n"
+               "  python main.py --all --range A-G --offline             # Rebuild batch_AG.parquet from cached pages\n"
+               "  python main.py --all --offline --parse-workers 4       # Re-parse cached pages on 4 processes\n"
+               "  python main.py --all --range A-G --dataset             # Append to the partitioned dataset\n"
+               "  python main.py --compact                               # Merge small dataset files",
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     
@@ -28,17 +36,137 @@ def parse_arguments():
         "--range", 
         help="Alphabetical range (e.g., 'A-G', 'M', 'N-Z')"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Maximum number of requests in flight (default: 1, sequential)"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="Token-bucket request rate per host in requests/second (default: 1/3 when --concurrency > 1)"
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="Token-bucket burst size per host (default: 1)"
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=10,
+        help="Maximum keep-alive connections per host (default: 10)"
+    )
+    parser.add_argument(
+        "--conditional",
+        action="store_true",
+        help="Send ETag/Last-Modified validators from the previous run and reuse unchanged (304) pages"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Cache raw HTML pages under ./data/page_cache/"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=168,
+        help="Page cache time-to-live in hours (default: 168)"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=512,
+        help="Page cache size limit in MB; least recently used pages are evicted (default: 512)"
+    )
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="Re-parse cached pages regardless of age, fetching only pages missing from the cache"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Rebuild the output from cached pages only, without any network traffic"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Discard any checkpoint left by an interrupted run and start over"
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=10,
+        help="Flush completed locations to the checkpoint journal every N records (default: 10)"
+    )
+    parser.add_argument(
+        "--parser",
+        choices=HtmlParser.BACKENDS,
+        help="HTML parser backend (default: lxml if installed, otherwise bs4)"
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Parse pages in N worker processes, decoupled from fetching (default: 0, parse inline)"
+    )
+    parser.add_argument(
+        "--refresh-urls",
+        action="store_true",
+        help="Ignore remembered city URL formats and known-missing cities from previous runs"
+    )
+    parser.add_argument(
+        "--dataset",
+        action="store_true",
+        help="Append results to the hive-partitioned dataset in ./data/dataset/ instead of a single file"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Merge the dataset's small part files into one file per partition, then exit"
+    )
+    parser.add_argument(
+        "--base-url",
+        help="Override the Numbeo base URL (e.g., a local stub server for testing)"
+    )
     
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_arguments()
 
+    if args.compact:
+        FileManager().compact_dataset()
+        exit(0)
+
     if not args.all and not args.include:
         print("Error: Must specify either --all or --include")
         exit(1)
 
-    scraper = CostOfLivingScraper()
+    if args.base_url:
+        UrlFormatter.BASE_URL = args.base_url.rstrip('/') + '/'
+
+    scraper = CostOfLivingScraper(
+        max_concurrency=args.concurrency,
+        requests_per_second=args.rate,
+        burst=args.burst,
+        pool_size=args.pool_size,
+        conditional=args.conditional,
+        cache=args.cache,
+        cache_ttl=args.cache_ttl * 3600,
+        cache_size=int(args.cache_size * 1024 ** 2),
+        reparse=args.reparse,
+        offline=args.offline,
+        resume=not args.no_resume,
+        checkpoint_every=args.checkpoint_every,
+        parser_backend=args.parser,
+        parse_workers=args.parse_workers,
+        refresh_urls=args.refresh_urls,
+        dataset=args.dataset
+    )
     scraper.run(
         download_all=args.all,
         include_locations=args.include,
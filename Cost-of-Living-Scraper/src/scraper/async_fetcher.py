@@ -0,0 +1,37 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncFetcher:
+    """Runs blocking fetch jobs concurrently with a bounded number in flight."""
+    
+    def __init__(self, max_concurrency=8):
+        self.max_concurrency = max_concurrency
+    
+    async def _run_job(self, semaphore, executor, index, job):
+        """Run a single job in the thread pool once a slot is free."""
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return index, await loop.run_in_executor(executor, job)
+    
+    async def _run_all(self, jobs, on_result):
+        """Schedule all jobs and collect results as they complete."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = None if on_result else [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            tasks = [self._run_job(semaphore, executor, i, job) for i, job in enumerate(jobs)]
+            for future in asyncio.as_completed(tasks):
+                index, result = await future
+                if on_result:
+                    on_result(index, result)
+                else:
+                    results[index] = result
+        return results
+    
+    def run(self, jobs, on_result=None):
+        """Run zero-argument callables concurrently and return their results in input order.
+        
+        If on_result is given, each result is handed to it as it completes instead of being kept.
+        """
+        if not jobs:
+            return []
+        return asyncio.run(self._run_all(jobs, on_result))
@@ -0,0 +1,76 @@
+import os
+import json
+
+class Checkpoint:
+    """Journals completed locations to disk so an interrupted run can resume."""
+
+    def __init__(self, data_dir, name):
+        self.journal_path = os.path.join(data_dir, f"{name}.journal.jsonl")
+        self.manifest_path = os.path.join(data_dir, f"{name}.checkpoint.json")
+        self.completed = set()
+        self.processor_state = None
+
+    @staticmethod
+    def location_key(country, city):
+        return f"{country}|{city}"
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def load(self):
+        """Load completed locations and column state from the manifest."""
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        self.completed = set(manifest['completed'])
+        self.processor_state = manifest['processor_state']
+        self._truncate_journal(manifest['journal_bytes'])
+        return len(self.completed)
+
+    def _truncate_journal(self, size):
+        """Drop journal lines written after the last manifest update."""
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > size:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(size)
+
+    def is_done(self, country, city):
+        return self.location_key(country, city) in self.completed
+
+    def append(self, records, processor_state):
+        """Append records to the journal, then record them as completed in the manifest."""
+        with open(self.journal_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(self.location_key(r['Country'], r['City']) for r in records)
+        self.processor_state = processor_state
+        manifest = {
+            'completed': sorted(self.completed),
+            'processor_state': processor_state,
+            'journal_bytes': os.path.getsize(self.journal_path)
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def iter_records(self, chunk_size=500):
+        """Yield journaled records in chunks."""
+        if not os.path.exists(self.journal_path):
+            return
+        chunk = []
+        with open(self.journal_path) as f:
+            for line in f:
+                chunk.append(json.loads(line))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def clear(self):
+        """Remove the journal and manifest after a successful run."""
+        for path in (self.journal_path, self.manifest_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.completed = set()
@@ -1,19 +1,92 @@
+from array import array
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 
 class DataProcessor:
-    """Handles data processing and column management."""
+    """Handles data processing and column management.
+    
+    Records are accumulated column-wise: every numeric column name is interned
+    to an integer id and its values are appended to a typed float64 array.
+    The master column order is kept as a linked list of column ids, so adding
+    a record costs time linear in the number of items it contains.
+    """
+    
+    ID_COLUMNS = ["Country", "City"]
     
     def __init__(self):
-        self.data = []
-        self.master_columns = ["Country", "City", "Entries"]
+        self.countries = []
+        self.cities = []
+        self.column_ids = {}  # column name -> id
+        self.column_names = []  # id -> column name
+        self.values = []  # id -> array('d') of values, shorter than num_rows if trailing rows are missing
+        self.next_column = []  # id -> id of the following column in master order, or None
         self.column_mapping = {}
+        self.entries_id = self._intern("Entries", after=None)
+    
+    @property
+    def num_rows(self):
+        return len(self.countries)
+    
+    @property
+    def master_columns(self):
+        """Column names in master order."""
+        columns = list(self.ID_COLUMNS)
+        col_id = self.entries_id
+        while col_id is not None:
+            columns.append(self.column_names[col_id])
+            col_id = self.next_column[col_id]
+        return columns
+    
+    @property
+    def data(self):
+        """Buffered records as dicts."""
+        return self._to_records()
+    
+    def _intern(self, name, after):
+        """Return the id of a column, inserting it after column id `after` if new."""
+        col_id = self.column_ids.get(name)
+        if col_id is not None:
+            return col_id
+        
+        col_id = len(self.column_names)
+        self.column_ids[name] = col_id
+        self.column_names.append(name)
+        self.values.append(array('d'))
+        if after is None:
+            self.next_column.append(None)
+        else:
+            self.next_column.append(self.next_column[after])
+            self.next_column[after] = col_id
+        return col_id
+    
+    def _set_value(self, col_id, row, value):
+        """Store a value, padding skipped rows of the column with NaN."""
+        column = self.values[col_id]
+        if len(column) > row:
+            column[row] = value
+            return
+        if len(column) < row:
+            column.extend(array('d', [np.nan]) * (row - len(column)))
+        column.append(value)
+    
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return np.nan
     
     def add_record(self, country, city, parsed_data, entries_count):
         """Add a new record to the dataset."""
-        record = {"Country": country, "City": city, "Entries": entries_count}
+        row = self.num_rows
+        self.countries.append(country)
+        self.cities.append(city)
+        self._set_value(self.entries_id, row, self._to_float(entries_count))
+        
         column_counts = {}
-        columns_order = ["Country", "City", "Entries"]
+        seen = {self.entries_id}
+        cursor = self.entries_id  # Position in master order after which new columns are inserted
         
         for item in parsed_data:
             name = item['name']
@@ -28,45 +101,85 @@ class DataProcessor:
                 unique_name = name if occurrence == 1 else f"{name}_{occurrence}"
                 self.column_mapping[key] = unique_name
             
-            # Add data
-            record[unique_name] = item['price']
-            record[f"{unique_name} Low Range"] = item['low']
-            record[f"{unique_name} High Range"] = item['high']
-            
-            # Update column order
-            for col in [unique_name, f"{unique_name} Low Range", f"{unique_name} High Range"]:
-                if col not in columns_order:
-                    columns_order.append(col)
-        
-        self._update_master_columns(columns_order)
-        self.data.append(record)
+            # Add data and update column order
+            for col, value in ((unique_name, item['price']),
+                               (f"{unique_name} Low Range", item['low']),
+                               (f"{unique_name} High Range", item['high'])):
+                col_id = self._intern(col, after=cursor)
+                if col_id not in seen:
+                    seen.add(col_id)
+                    cursor = col_id
+                self._set_value(col_id, row, self._to_float(value))
     
-    def _update_master_columns(self, new_columns):
-        """Update master column list maintaining order."""
-        master_i = new_i = 0
-        
-        while new_i < len(new_columns):
-            new_col = new_columns[new_i]
-            if master_i < len(self.master_columns) and self.master_columns[master_i] == new_col:
-                master_i += 1
-            elif new_col in self.master_columns:
-                master_i = self.master_columns.index(new_col) + 1
-            else:
-                self.master_columns.insert(master_i, new_col)
-                master_i += 1
-            new_i += 1
+    def _reset_rows(self):
+        self.countries = []
+        self.cities = []
+        self.values = [array('d') for _ in self.column_names]
     
-    def to_dataframe(self):
-        """Convert data to pandas DataFrame."""
-        df = pd.DataFrame(self.data, columns=self.master_columns)
-        
-        # Convert numeric columns
-        for col in df.columns:
-            if col not in ['Country', 'City']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+    def _to_records(self):
+        records = [{"Country": country, "City": city} for country, city in zip(self.countries, self.cities)]
+        for name, column in zip(self.column_names, self.values):
+            for row, value in enumerate(column):
+                records[row][name] = value
+        return records
+    
+    def drain(self):
+        """Return buffered records and clear the buffer."""
+        records = self._to_records()
+        self._reset_rows()
+        return records
+    
+    def get_state(self):
+        """Return the column state needed to resume a run."""
+        return {
+            'master_columns': self.master_columns,
+            'column_mapping': [[name, occurrence, unique_name]
+                               for (name, occurrence), unique_name in self.column_mapping.items()]
+        }
+    
+    def load_state(self, state):
+        """Restore column state saved by get_state."""
+        self.__init__()
+        previous = self.entries_id
+        for name in state['master_columns'][len(self.ID_COLUMNS):]:
+            previous = self._intern(name, after=previous)
+        self.column_mapping = {(name, occurrence): unique_name
+                               for name, occurrence, unique_name in state['column_mapping']}
+    
+    def _column_arrays(self, records=None):
+        """Float64 arrays per column id, padded to the number of rows."""
+        if records is None:
+            n_rows = self.num_rows
+            columns = []
+            for column in self.values:
+                if len(column) < n_rows:
+                    column.extend(array('d', [np.nan]) * (n_rows - len(column)))
+                columns.append(np.frombuffer(column, dtype=np.float64))
+            return self.countries, self.cities, columns
         
-        # Ensure float64 for numeric columns
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        df[numeric_cols] = df[numeric_cols].astype('float64')
+        columns = [np.full(len(records), np.nan) for _ in self.column_names]
+        for row, record in enumerate(records):
+            for name, value in record.items():
+                if name not in self.ID_COLUMNS:
+                    columns[self.column_ids[name]][row] = self._to_float(value)
+        return [r["Country"] for r in records], [r["City"] for r in records], columns
+    
+    def to_arrow(self, records=None):
+        """Build an Arrow table in master column order.
         
-        return df
+        Numeric columns share memory with the accumulator; drain or stop adding
+        records while the table is in use.
+        """
+        countries, cities, columns = self._column_arrays(records)
+        arrays = [pa.array(countries, pa.string()), pa.array(cities, pa.string())]
+        names = self.master_columns
+        arrays.extend(pa.array(columns[self.column_ids[name]]) for name in names[len(self.ID_COLUMNS):])
+        return pa.Table.from_arrays(arrays, names=names)
+    
+    def to_dataframe(self, records=None):
+        """Convert data (or the given records) to pandas DataFrame."""
+        countries, cities, columns = self._column_arrays(records)
+        names = self.master_columns
+        data = {"Country": countries, "City": cities}
+        data.update((name, columns[self.column_ids[name]]) for name in names[len(self.ID_COLUMNS):])
+        return pd.DataFrame(data, columns=names, copy=True)
@@ -1,8 +1,19 @@
 import os
+import json
+import uuid
+from datetime import date
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 class FileManager:
     """Handles file operations."""
     
+    DATASET_DIR = 'dataset'
+    SCHEMA_FILE = '_schema.json'
+    ID_COLUMNS = ['Country', 'City']
+    PARTITIONING = ds.partitioning(pa.schema([('scrape_date', pa.string()), ('letter', pa.string())]), flavor='hive')
+    
     def __init__(self, data_dir='data'):
         self.data_dir = os.path.join(os.getcwd(), data_dir)
         os.makedirs(self.data_dir, exist_ok=True)
@@ -13,3 +24,120 @@ class FileManager:
         df.to_parquet(output_path, index=False)
         print(f"Data saved successfully to {output_path}")
         return output_path
+    
+    def save_parquet_chunks(self, frames, filename='cost_of_living_data.parquet'):
+        """Write DataFrames with identical columns to one Parquet file, one row group each."""
+        output_path = os.path.join(self.data_dir, filename)
+        tmp_path = f"{output_path}.tmp"
+        writer = None
+        try:
+            for df in frames:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            return None
+        os.replace(tmp_path, output_path)
+        print(f"Data saved successfully to {output_path}")
+        return output_path
+    
+    @property
+    def dataset_dir(self):
+        return os.path.join(self.data_dir, self.DATASET_DIR)
+    
+    def dataset_schema(self):
+        """Unified Arrow schema of every file in the dataset (without partition columns)."""
+        path = os.path.join(self.dataset_dir, self.SCHEMA_FILE)
+        columns = self.ID_COLUMNS
+        if os.path.exists(path):
+            with open(path) as f:
+                columns = json.load(f)
+        return pa.schema([(col, pa.string() if col in self.ID_COLUMNS else pa.float64()) for col in columns])
+    
+    def _extend_dataset_schema(self, columns):
+        """Append columns not yet in the unified schema, keeping existing order."""
+        known = self.dataset_schema().names
+        new_columns = [col for col in columns if col not in known]
+        if new_columns:
+            os.makedirs(self.dataset_dir, exist_ok=True)
+            with open(os.path.join(self.dataset_dir, self.SCHEMA_FILE), 'w') as f:
+                json.dump(known + new_columns, f)
+        return self.dataset_schema()
+    
+    def save_dataset(self, frames, scrape_date=None):
+        """Write DataFrames into the dataset, partitioned by scrape date and first letter of the country."""
+        scrape_date = (scrape_date or date.today()).isoformat()
+        schema = None
+        n_rows = 0
+        for df in frames:
+            if schema is None:
+                schema = self._extend_dataset_schema(list(df.columns))
+            df = df.reindex(columns=schema.names)
+            letters = df['Country'].str[0].str.upper()
+            for letter, part in df.groupby(letters, sort=True):
+                partition_dir = os.path.join(self.dataset_dir, f"scrape_date={scrape_date}", f"letter={letter}")
+                os.makedirs(partition_dir, exist_ok=True)
+                table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+                pq.write_table(table, os.path.join(partition_dir, f"part-{uuid.uuid4().hex}.parquet"))
+                n_rows += len(part)
+        if schema is None:
+            return None
+        print(f"{n_rows} rows saved successfully to {self.dataset_dir} (scrape_date={scrape_date})")
+        return self.dataset_dir
+    
+    def load_dataset(self, columns=None, filter=None):
+        """Read the dataset with column projection and predicate pushdown, as a DataFrame.
+        
+        Example: load_dataset(['Country', 'City', 'Entries'], ds.field('Country') == 'Japan')
+        """
+        schema = self.dataset_schema()
+        for field in self.PARTITIONING.schema:
+            schema = schema.append(field)
+        dataset = ds.dataset(self.dataset_dir, format='parquet', partitioning=self.PARTITIONING, schema=schema,
+                             exclude_invalid_files=True)
+        return dataset.to_table(columns=columns, filter=filter).to_pandas()
+    
+    def compact_dataset(self, row_group_size=1_000_000):
+        """Merge the part files of each partition into one file with large, sorted row groups."""
+        schema = self.dataset_schema()
+        compacted = 0
+        for date_dir in sorted(os.scandir(self.dataset_dir), key=lambda e: e.name) if os.path.isdir(self.dataset_dir) else []:
+            if not date_dir.is_dir():
+                continue
+            for partition in sorted(os.scandir(date_dir.path), key=lambda e: e.name):
+                parts = sorted(e.path for e in os.scandir(partition.path) if e.name.endswith('.parquet'))
+                if len(parts) < 2 and all(pq.read_schema(p).names == schema.names for p in parts):
+                    continue
+                # Sorting by country/city keeps per-row-group min/max statistics tight for pushdown
+                table = ds.dataset(parts, format='parquet', schema=schema).to_table()
+                table = table.sort_by([('Country', 'ascending'), ('City', 'ascending')])
+                name = uuid.uuid4().hex
+                output_path = os.path.join(partition.path, f"part-{name}.parquet")
+                tmp_path = os.path.join(partition.path, f".{name}.tmp")  # Hidden from dataset discovery
+                pq.write_table(table, tmp_path, row_group_size=row_group_size, write_statistics=True)
+                os.replace(tmp_path, output_path)
+                for part in parts:
+                    os.remove(part)
+                compacted += 1
+                print(f"Compacted {len(parts)} files ({table.num_rows} rows) in {date_dir.name}/{partition.name}")
+        print(f"Compaction finished: {compacted} partitions rewritten.")
+        return compacted
+    
+    def load_json(self, filename, default=None):
+        """Load a JSON state file, returning default if it does not exist."""
+        path = os.path.join(self.data_dir, filename)
+        if not os.path.exists(path):
+            return default
+        with open(path) as f:
+            return json.load(f)
+    
+    def save_json(self, obj, filename):
+        """Save an object to a JSON state file."""
+        path = os.path.join(self.data_dir, filename)
+        with open(path, 'w') as f:
+            json.dump(obj, f)
+        return path
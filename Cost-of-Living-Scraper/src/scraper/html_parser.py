@@ -2,9 +2,21 @@ import re
 import numpy as np
 from bs4 import BeautifulSoup
 
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; BeautifulSoup is used instead
+    lxml = None
+
+ENTRIES_PATTERN = re.compile(r'This\s+(?:country|city)\s+had\s+(\d+)\s+entries', re.IGNORECASE)
+# Text nodes BeautifulSoup's get_text() would see (it skips script, style and template contents)
+VISIBLE_TEXT = 'text()[not(ancestor::script or ancestor::style or ancestor::template)]'
+
 class HtmlParser:
     """Parses HTML content from Numbeo pages."""
     
+    BACKENDS = ('lxml', 'bs4')
+    default_backend = 'lxml' if lxml is not None else 'bs4'
+    
     @staticmethod
     def get_countries(html_content):
         """Extract country list from main page."""
@@ -19,8 +31,26 @@ class HtmlParser:
         return countries
     
     @staticmethod
-    def parse_cost_data(html_content):
-        """Parse cost of living data from HTML table."""
+    def parse_cost_data(html_content, backend=None):
+        """Parse cost of living data from HTML table.
+        
+        backend is 'lxml' (compiled fast path) or 'bs4'; defaults to lxml when installed.
+        The lxml path falls back to BeautifulSoup if it cannot find the table.
+        """
+        backend = backend or HtmlParser.default_backend
+        if backend not in HtmlParser.BACKENDS:
+            raise ValueError(f"Unknown parser backend '{backend}'. Choose from {HtmlParser.BACKENDS}.")
+        if backend == 'lxml':
+            if lxml is None:
+                raise ImportError("The 'lxml' parser backend requires lxml to be installed.")
+            data, entries_count = HtmlParser._parse_cost_data_lxml(html_content)
+            if data is not None:
+                return data, entries_count
+        return HtmlParser._parse_cost_data_bs4(html_content)
+    
+    @staticmethod
+    def _parse_cost_data_bs4(html_content):
+        """Parse cost data with BeautifulSoup's pure-Python html.parser."""
         soup = BeautifulSoup(html_content, "html.parser")
         table = soup.find("table", class_="data_wide_table")
         
@@ -28,18 +58,47 @@ class HtmlParser:
             return None, None
         
         # Extract entries count
-        entries_match = re.search(r'This\s+(?:country|city)\s+had\s+(\d+)\s+entries', 
-                                soup.get_text(), re.IGNORECASE)
+        entries_match = ENTRIES_PATTERN.search(soup.get_text())
         entries_count = int(entries_match.group(1)) if entries_match else np.nan
         
         # Parse table data
+        rows = ([col.text for col in row.find_all("td")] for row in table.find_all("tr"))
+        return HtmlParser._parse_rows(rows), entries_count
+    
+    @staticmethod
+    def _parse_cost_data_lxml(html_content):
+        """Parse cost data with lxml, walking only the table and the entries sentence."""
+        try:
+            root = lxml.html.fromstring(html_content)
+        except (ValueError, lxml.etree.ParserError):
+            return None, None
+        tables = root.xpath('//table[contains(concat(" ", normalize-space(@class), " "), " data_wide_table ")]')
+        if not tables:
+            return None, None
+        
+        # Extract entries count from the elements holding the sentence, not the whole document
+        entries_match = None
+        for element in root.xpath(f'//*[{VISIBLE_TEXT}[contains(translate(., "ENTRIES", "entries"), "entries")]]'):
+            entries_match = ENTRIES_PATTERN.search(''.join(element.xpath(f'.//{VISIBLE_TEXT}')))
+            if entries_match:
+                break
+        if entries_match is None:
+            entries_match = ENTRIES_PATTERN.search(''.join(root.xpath(f'//{VISIBLE_TEXT}')))
+        entries_count = int(entries_match.group(1)) if entries_match else np.nan
+        
+        # Parse table data
+        rows = ([col.text_content() for col in row.iter("td")] for row in tables[0].iter("tr"))
+        return HtmlParser._parse_rows(rows), entries_count
+    
+    @staticmethod
+    def _parse_rows(rows):
+        """Convert table rows (lists of cell texts) into item dicts."""
         data = []
-        for row in table.find_all("tr"):
-            cols = row.find_all("td")
+        for cols in rows:
             if cols:
-                name = cols[0].text.strip()
-                price = HtmlParser._clean_price(cols[1].text.strip())
-                range_data = cols[2].text.strip() if len(cols) > 2 else ""
+                name = cols[0].strip()
+                price = HtmlParser._clean_price(cols[1].strip())
+                range_data = cols[2].strip() if len(cols) > 2 else ""
                 low, high = HtmlParser._parse_range(range_data)
                 
                 data.append({
@@ -49,7 +108,7 @@ class HtmlParser:
                     'high': high
                 })
         
-        return data, entries_count
+        return data
     
     @staticmethod
     def _clean_price(price_str):
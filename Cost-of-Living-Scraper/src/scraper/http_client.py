@@ -1,20 +1,87 @@
 import time
 import random
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from .run_metrics import RunMetrics
 
 class HttpClient:
     """Handles HTTP requests with retry logic and rate limiting."""
     
-    def __init__(self, timeout=10, rate_limit=3):  # Increased from 1 to 3 seconds
+    def __init__(self, timeout=10, rate_limit=3, rate_limiter=None, pool_size=10, metrics=None):  # Increased from 1 to 3 seconds
         self.timeout = timeout
         self.rate_limit = rate_limit
+        self.rate_limiter = rate_limiter  # Shared HostRateLimiter replaces the fixed sleep when set
+        self.session = self._create_session(pool_size)
+        self.validators = {}  # url -> {'ETag': ..., 'Last-Modified': ...}
+        self.stats = {'requests': 0, 'bytes_downloaded': 0, 'not_modified': 0}
+        self.metrics = metrics or RunMetrics()  # Request spans, retry and backoff counters
+        self._lock = threading.Lock()
     
-    def get(self, url, retries=3, backoff=5):  # Increased backoff from 2 to 5 seconds
-        """Make HTTP GET request with retry logic."""
+    @staticmethod
+    def _create_session(pool_size):
+        """Create a keep-alive session with a bounded connection pool."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    def _conditional_headers(self, url):
+        """Build If-None-Match/If-Modified-Since headers from stored validators."""
+        validators = self.validators.get(url, {})
+        headers = {}
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+        return headers
+    
+    def _record_response(self, url, response):
+        """Update counters and stored validators after a response."""
+        with self._lock:
+            self.stats['requests'] += 1
+            if response.status_code == 304:
+                self.stats['not_modified'] += 1
+                return
+            self.stats['bytes_downloaded'] += len(response.content)
+            validators = {k: response.headers[k] for k in ('ETag', 'Last-Modified') if k in response.headers}
+            if validators:
+                self.validators[url] = validators
+    
+    def connections_opened(self):
+        """Count connections opened by the session's pools."""
+        opened = 0
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                opened += pools[key].num_connections
+        return opened
+    
+    def get_stats(self):
+        """Return request, byte, connection reuse and 304 counters."""
+        stats = dict(self.stats)
+        stats['connections_opened'] = self.connections_opened()
+        stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+        return stats
+    
+    def get(self, url, retries=3, backoff=5, conditional=False):  # Increased backoff from 2 to 5 seconds
+        """Make HTTP GET request with retry logic.
+        
+        With conditional=True, stored validators are sent and an unchanged
+        page comes back as a 304 response with an empty body.
+        """
+        headers = self._conditional_headers(url) if conditional else {}
         for attempt in range(retries):
+            if attempt:
+                self.metrics.count('retries')
+            if self.rate_limiter:
+                self.metrics.count('rate_limiter_wait_s', self.rate_limiter.acquire(url))
             try:
-                response = requests.get(url, timeout=self.timeout)
+                with self.metrics.span('request'):
+                    response = self.session.get(url, timeout=self.timeout, headers=headers)
+                self._record_response(url, response)
                 response.raise_for_status()
                 return response
                 
@@ -22,6 +89,10 @@ class HttpClient:
                 if e.response.status_code == 429:  # Rate limited
                     wait_time = backoff * (2 ** attempt) + random.uniform(1, 3)  # Exponential backoff + jitter
                     print(f"Rate limited. Waiting {wait_time:.1f}s before retry {attempt + 1}/{retries}")
+                    self.metrics.count('rate_limited')
+                    self.metrics.count('backoff_s', wait_time)
+                    if self.rate_limiter:
+                        self.rate_limiter.pause(url, wait_time)  # Hold back other workers on this host too
                     time.sleep(wait_time)
                 else:
                     raise e
@@ -30,12 +101,17 @@ class HttpClient:
                 if attempt < retries - 1:
                     wait_time = backoff * (attempt + 1)
                     print(f"Retrying {url} in {wait_time}s... (Attempt {attempt + 2}/{retries})")
+                    self.metrics.count('request_errors')
+                    self.metrics.count('backoff_s', wait_time)
                     time.sleep(wait_time)
                 else:
                     print(f"Failed to fetch {url} after {retries} attempts: {e}")
+                    self.metrics.count('request_errors')
                     return None
             finally:
                 # Add randomized delay to look more human-like
-                delay = self.rate_limit + random.uniform(0, 2)
-                time.sleep(delay)
+                if not self.rate_limiter:
+                    delay = self.rate_limit + random.uniform(0, 2)
+                    self.metrics.count('politeness_delay_s', delay)
+                    time.sleep(delay)
         return None
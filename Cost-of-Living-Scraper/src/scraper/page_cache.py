@@ -0,0 +1,69 @@
+import os
+import gzip
+import time
+import hashlib
+import threading
+
+class PageCache:
+    """On-disk cache of compressed HTML bodies with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, cache_dir, ttl=7 * 24 * 3600, max_bytes=512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._blob_paths())
+
+    @staticmethod
+    def key(url):
+        """Content address of a URL."""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, f"{self.key(url)}.html.gz")
+
+    def _blob_paths(self):
+        return [entry.path for entry in os.scandir(self.cache_dir) if entry.name.endswith('.html.gz')]
+
+    def get(self, url, ignore_ttl=False):
+        """Return the cached body for a URL, or None if missing or expired."""
+        path = self._path(url)
+        try:
+            stored_at = os.path.getmtime(path)
+            if not ignore_ttl and time.time() - stored_at > self.ttl:
+                self.stats['expired'] += 1
+                return None
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                html = f.read()
+            # Access time tracks recency for LRU, modification time tracks age for TTL
+            os.utime(path, (time.time(), stored_at))
+        except (OSError, EOFError):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return html
+
+    def put(self, url, html):
+        """Store a body and evict least recently used entries beyond the size limit."""
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write(html)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.total_bytes += os.path.getsize(path) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently accessed blobs until the cache fits its size limit."""
+        entries = sorted((os.stat(path).st_atime, path) for path in self._blob_paths())
+        for _, path in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.total_bytes -= os.path.getsize(path)
+            os.remove(path)
+            self.stats['evicted'] += 1
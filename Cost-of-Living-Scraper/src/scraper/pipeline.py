@@ -0,0 +1,138 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .html_parser import HtmlParser
+
+def _parse_page(html, backend):
+    """Parse one page in a worker process and time it."""
+    start = time.perf_counter()
+    result = HtmlParser.parse_cost_data(html, backend=backend)
+    return result, time.perf_counter() - start
+
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, start, elapsed):
+        with self._lock:
+            self.items += 1
+            self.busy += elapsed
+            self.first_start = start if self.first_start is None else min(self.first_start, start)
+            self.last_end = max(self.last_end or 0.0, start + elapsed)
+
+    def summary(self):
+        wall = (self.last_end - self.first_start) if self.items else 0.0
+        rate = self.items / wall if wall > 0 else 0.0
+        return f"{self.name}: {self.items} pages in {wall:.1f}s ({rate:.1f} pages/s, {self.busy:.1f}s busy)"
+
+class ParsePipeline:
+    """Producer/consumer pipeline: fetch threads feed HTML bodies to a pool of parser processes.
+
+    Each location is a list of candidate URLs tried in order until one parses;
+    an empty list is reported as a failure without fetching anything.
+    The fetch callable returns HTML to parse, an already parsed (data, entries)
+    tuple, or None on failure.
+    """
+
+    def __init__(self, fetch, fetch_workers=1, parse_workers=None, queue_size=64, parser_backend=None, metrics=None):
+        self.fetch = fetch
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.parser_backend = parser_backend
+        self.metrics = metrics  # Optional RunMetrics receiving per-page parse spans
+        self.fetch_stats = StageStats("fetch")
+        self.parse_stats = StageStats("parse")
+        self.depth_samples = []
+
+    def _fetch_body(self, events, slots, index, attempt, url):
+        """Fetch one URL in a fetch thread once a queue slot is free."""
+        slots.acquire()
+        start = time.perf_counter()
+        try:
+            body = self.fetch(url)
+        except Exception:
+            body = None
+        self.fetch_stats.record(start, time.perf_counter() - start)
+        events.put(('fetched', index, attempt, url, body))
+
+    def run(self, locations, on_result):
+        """Fetch and parse every location, calling on_result(index, url, result) as each finishes."""
+        events = queue.Queue()
+        slots = threading.Semaphore(self.queue_size)  # Bodies fetched but not yet handed to a parser
+        backlog = deque()
+        remaining = len(locations)
+        in_flight = 0
+
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as fetchers, \
+                ProcessPoolExecutor(max_workers=self.parse_workers) as parsers:
+
+            def submit_fetch(index, attempt):
+                fetchers.submit(self._fetch_body, events, slots, index, attempt, locations[index][attempt])
+
+            def submit_parse():
+                nonlocal in_flight
+                while backlog and in_flight < self.parse_workers:
+                    index, attempt, url, html = backlog.popleft()
+                    future = parsers.submit(_parse_page, html, self.parser_backend)
+                    future.add_done_callback(lambda f, i=index, a=attempt, u=url: events.put(('parsed', i, a, u, f)))
+                    in_flight += 1
+                    slots.release()
+
+            def finish(index, attempt, url, result):
+                nonlocal remaining
+                if result and result[0]:
+                    on_result(index, url, result)
+                elif attempt + 1 < len(locations[index]):
+                    submit_fetch(index, attempt + 1)
+                    return
+                else:
+                    on_result(index, url, None)
+                remaining -= 1
+
+            for index in range(len(locations)):
+                if locations[index]:
+                    submit_fetch(index, 0)
+                else:
+                    on_result(index, None, None)
+                    remaining -= 1
+
+            while remaining:
+                kind, index, attempt, url, payload = events.get()
+                if kind == 'fetched':
+                    if isinstance(payload, str):
+                        backlog.append((index, attempt, url, payload))
+                    else:
+                        slots.release()
+                        finish(index, attempt, url, payload)
+                else:
+                    in_flight -= 1
+                    try:
+                        result, elapsed = payload.result()
+                        self.parse_stats.record(time.perf_counter() - elapsed, elapsed)
+                        if self.metrics:
+                            self.metrics.record('parse', elapsed)
+                    except Exception:
+                        result = None
+                    finish(index, attempt, url, result)
+                submit_parse()
+                self.depth_samples.append(len(backlog))
+
+    def summary(self):
+        """Per-stage throughput and parse queue depth."""
+        samples = self.depth_samples or [0]
+        return [
+            self.fetch_stats.summary() + f", {self.fetch_workers} threads",
+            self.parse_stats.summary() + f", {self.parse_workers} processes",
+            f"parse queue depth: max {max(samples)}, mean {sum(samples) / len(samples):.1f}"
+        ]
@@ -0,0 +1,66 @@
+import time
+import threading
+from urllib.parse import urlparse
+
+class TokenBucket:
+    """Thread-safe token bucket enforcing an average request rate."""
+    
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        """Add tokens accrued since the last update."""
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+    
+    def reserve(self):
+        """Reserve one token and return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+    
+    def acquire(self):
+        """Block until a token is available."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    def pause(self, seconds):
+        """Hold back every caller of this bucket, e.g. after a 429 response."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class HostRateLimiter:
+    """Keeps one shared token bucket per host."""
+    
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self._lock = threading.Lock()
+    
+    def bucket(self, url):
+        """Return the bucket for the host of a URL."""
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+    
+    def acquire(self, url):
+        """Block until a request to this URL's host is allowed."""
+        return self.bucket(url).acquire()
+    
+    def pause(self, url, seconds):
+        """Back off every pending request to this URL's host."""
+        self.bucket(url).pause(seconds)
@@ -0,0 +1,62 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+class RunMetrics:
+    """Collects timing spans per stage and event counters for a scraper run."""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}  # stage -> list of seconds
+        self.counters = {}
+        self._lock = threading.Lock()
+    
+    def record(self, stage, seconds):
+        """Record one duration for a stage."""
+        with self._lock:
+            self.durations.setdefault(stage, []).append(seconds)
+    
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as one span of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+    
+    def count(self, name, value=1):
+        """Increment a counter (value may be seconds, e.g. backoff time)."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def summary(self):
+        """Per-stage count, total and latency percentiles, plus counters."""
+        stages = {}
+        with self._lock:
+            durations = {stage: np.array(values) for stage, values in self.durations.items()}
+            counters = dict(self.counters)
+        for stage, values in durations.items():
+            stages[stage] = {
+                'count': int(values.size),
+                'total_s': float(values.sum()),
+                'mean_s': float(values.mean()),
+                'p50_s': float(np.percentile(values, 50)),
+                'p95_s': float(np.percentile(values, 95)),
+                'max_s': float(values.max())
+            }
+        return {
+            'wall_time_s': time.perf_counter() - self.started,
+            'stages': stages,
+            'counters': counters
+        }
+    
+    def write_report(self, path, **extra):
+        """Write the summary and any extra sections as JSON."""
+        report = self.summary()
+        report.update(extra)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
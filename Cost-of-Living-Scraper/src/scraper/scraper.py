@@ -1,26 +1,83 @@
+import os
+from functools import partial
+from requests.exceptions import RequestException
 from .http_client import HttpClient
 from .html_parser import HtmlParser
 from .url_formatter import UrlFormatter
 from .data_processor import DataProcessor
 from .file_manager import FileManager
+from .rate_limiter import HostRateLimiter
+from .async_fetcher import AsyncFetcher
+from .page_cache import PageCache
+from .checkpoint import Checkpoint
+from .pipeline import ParsePipeline
+from .url_resolver import UrlResolver
+from .run_metrics import RunMetrics
 
 class CostOfLivingScraper:
     """Main cost of living scraper orchestrator."""
     
-    def __init__(self):
-        self.http_client = HttpClient()
+    VALIDATORS_FILE = "http_validators.json"
+    PARSED_PAGES_FILE = "parsed_pages.json"
+    PAGE_CACHE_DIR = "page_cache"
+    URL_RESOLUTION_FILE = "city_urls.json"
+    RUN_REPORT_SUFFIX = ".run_report.json"
+    NOT_MODIFIED = object()
+    
+    def __init__(self, max_concurrency=1, requests_per_second=None, burst=1, pool_size=10, conditional=False,
+                 cache=False, cache_ttl=7 * 24 * 3600, cache_size=512 * 1024 ** 2, reparse=False, offline=False,
+                 resume=True, checkpoint_every=10, parser_backend=None, parse_workers=0, refresh_urls=False,
+                 dataset=False):
+        self.max_concurrency = max_concurrency
+        self.dataset = dataset  # Write to the partitioned dataset instead of a single file
+        self.parser_backend = parser_backend
+        self.parse_workers = parse_workers  # >0 parses in a separate process pool
+        self.resume = resume
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint = None
+        self.conditional = conditional
+        self.reparse = reparse or offline  # Serve cached pages regardless of age
+        self.offline = offline  # Never touch the network
+        self.metrics = RunMetrics()
+        self.http_client = HttpClient(pool_size=max(pool_size, max_concurrency), metrics=self.metrics)
+        if requests_per_second is None and max_concurrency > 1:
+            requests_per_second = 1 / self.http_client.rate_limit
+        if requests_per_second:
+            self.http_client.rate_limiter = HostRateLimiter(requests_per_second, burst)
         self.data_processor = DataProcessor()
         self.file_manager = FileManager()
+        self.page_cache = None
+        if cache or self.reparse:
+            cache_dir = os.path.join(self.file_manager.data_dir, self.PAGE_CACHE_DIR)
+            self.page_cache = PageCache(cache_dir, ttl=cache_ttl, max_bytes=cache_size)
         self.missing_data = []
+        self.transient_failures = set()  # URLs that failed for reasons other than a missing page
+        url_entries = {} if refresh_urls else self.file_manager.load_json(self.URL_RESOLUTION_FILE, {})
+        self.url_resolver = UrlResolver(url_entries)
+        self.parsed_pages = {}  # url -> [parsed_data, entries_count], reused on 304
+        if conditional:
+            self._load_conditional_state()
         print("Initialized CostOfLivingScraper.")
     
+    def _load_conditional_state(self):
+        """Load validators and parsed pages from the previous conditional run."""
+        self.parsed_pages = self.file_manager.load_json(self.PARSED_PAGES_FILE, {})
+        validators = self.file_manager.load_json(self.VALIDATORS_FILE, {})
+        # Only revalidate pages whose parsed data we can reuse on a 304
+        self.http_client.validators = {url: v for url, v in validators.items() if url in self.parsed_pages}
+    
+    def _save_conditional_state(self):
+        """Persist validators and parsed pages for the next conditional run."""
+        self.file_manager.save_json(self.parsed_pages, self.PARSED_PAGES_FILE)
+        self.file_manager.save_json(self.http_client.validators, self.VALIDATORS_FILE)
+    
     def get_country_name_list(self):
         """Fetch list of available countries."""
-        response = self.http_client.get("https://www.numbeo.com/cost-of-living/")
-        if not response:
+        html = self._get_html(UrlFormatter.BASE_URL)
+        if not html:
             return []
         
-        countries = HtmlParser.get_countries(response.text)
+        countries = HtmlParser.get_countries(html)
         print(f"Fetched {len(countries)} countries.")
         return countries
     
@@ -39,17 +96,95 @@ class CostOfLivingScraper:
         
         return country_city_dict
     
-    def _fetch_location_data(self, url, country, city="average"):
-        """Fetch and process data for a single location."""
-        response = self.http_client.get(url)
+    def _get_html(self, url, conditional=False):
+        """Return page HTML from the page cache or the network.
+        
+        Returns None on failure, or NOT_MODIFIED if a conditional request got a 304.
+        """
+        with self.metrics.span('fetch'):
+            return self._load_html(url, conditional)
+    
+    def _load_html(self, url, conditional):
+        """Untimed body of _get_html."""
+        if self.page_cache:
+            html = self.page_cache.get(url, ignore_ttl=self.reparse)
+            if html is not None:
+                return html
+        if self.offline:
+            return None
+        
+        try:
+            response = self.http_client.get(url, conditional=conditional)
+        except RequestException as e:
+            print(f"Failed to fetch {url}: {e}")
+            if getattr(e, 'response', None) is None or e.response.status_code not in (404, 410):
+                self.transient_failures.add(url)
+            return None
         if not response:
-            return False
+            self.transient_failures.add(url)
+            return None
+        if response.status_code == 304:
+            return self.NOT_MODIFIED
+        
+        if self.page_cache:
+            self.page_cache.put(url, response.text)
+        return response.text
+    
+    def _download_location(self, url):
+        """Fetch and parse a single location page."""
+        html = self._get_html(url, conditional=self.conditional and url in self.parsed_pages)
+        if not html:
+            return None
+        
+        # Unchanged page: skip the parse and reuse the previous result
+        if html is self.NOT_MODIFIED:
+            parsed_data, entries_count = self.parsed_pages[url]
+            self.metrics.count('parse_skipped_not_modified')
+            return parsed_data, entries_count
         
-        parsed_data, entries_count = HtmlParser.parse_cost_data(response.text)
+        with self.metrics.span('parse'):
+            parsed_data, entries_count = HtmlParser.parse_cost_data(html, backend=self.parser_backend)
         if not parsed_data:
+            return None
+        
+        if self.conditional:
+            self.parsed_pages[url] = [parsed_data, entries_count]
+        return parsed_data, entries_count
+    
+    def _add_record(self, country, city, result):
+        """Add a parsed location and flush to the checkpoint journal when the buffer is full."""
+        with self.metrics.span('add_record'):
+            self.data_processor.add_record(country, city, *result)
+        if self.checkpoint and self.data_processor.num_rows >= self.checkpoint_every:
+            self._flush_checkpoint()
+    
+    def _flush_checkpoint(self):
+        """Move buffered records from memory to the checkpoint journal."""
+        records = self.data_processor.drain()
+        if records:
+            with self.metrics.span('checkpoint_flush'):
+                self.checkpoint.append(records, self.data_processor.get_state())
+    
+    def _start_checkpoint(self, filename):
+        """Open the checkpoint for an output file, resuming it if one exists."""
+        self.checkpoint = Checkpoint(self.file_manager.data_dir, os.path.splitext(filename)[0])
+        if self.resume and self.checkpoint.exists():
+            done = self.checkpoint.load()
+            self.data_processor.load_state(self.checkpoint.processor_state)
+            print(f"Resuming from checkpoint: {done} locations already done.")
+        else:
+            self.checkpoint.clear()
+    
+    def _is_done(self, country, city):
+        return self.checkpoint is not None and self.checkpoint.is_done(country, city)
+    
+    def _fetch_location_data(self, url, country, city="average"):
+        """Fetch and process data for a single location."""
+        result = self._download_location(url)
+        if not result:
             return False
         
-        self.data_processor.add_record(country, city, parsed_data, entries_count)
+        self._add_record(country, city, result)
         return True
         
     def run(self, download_all=False, include_locations=None, letter_range=None):
@@ -62,10 +197,56 @@ class CostOfLivingScraper:
         
         # Generate filename based on range
         filename = self._generate_filename(letter_range)
+        self._start_checkpoint(filename)
         
         # Download data
         self.merge_data(country_city_dict, download_all, letter_range)
-        self.save_data_to_parquet(filename)
+        with self.metrics.span('save'):
+            self.save_data_to_parquet(filename)
+        if self.conditional:
+            self._save_conditional_state()
+        self.file_manager.save_json(self.url_resolver.entries, self.URL_RESOLUTION_FILE)
+        self._print_http_stats()
+        self._write_run_report(filename)
+    
+    def _write_run_report(self, filename):
+        """Write per-stage latency percentiles and counters next to the output file."""
+        path = os.path.join(self.file_manager.data_dir, os.path.splitext(filename)[0] + self.RUN_REPORT_SUFFIX)
+        report = self.metrics.write_report(
+            path,
+            output=filename,
+            config={
+                'max_concurrency': self.max_concurrency,
+                'parse_workers': self.parse_workers,
+                'parser_backend': self.parser_backend or HtmlParser.default_backend,
+                'rate_limited': self.http_client.rate_limiter is not None,
+                'conditional': self.conditional,
+                'cache': self.page_cache is not None,
+                'offline': self.offline
+            },
+            http=self.http_client.get_stats(),
+            page_cache=self.page_cache.stats if self.page_cache else None,
+            url_resolver=self.url_resolver.stats,
+            missing_locations=len(self.missing_data)
+        )
+        print(f"\nRun report ({report['wall_time_s']:.1f}s wall) saved to {path}")
+        for stage, stats in report['stages'].items():
+            print(f"  {stage}: {stats['count']} spans, p50 {stats['p50_s'] * 1000:.1f} ms, "
+                  f"p95 {stats['p95_s'] * 1000:.1f} ms, total {stats['total_s']:.1f}s")
+        if report['counters']:
+            print("  " + ", ".join(f"{name}={value:g}" for name, value in sorted(report['counters'].items())))
+    
+    def _print_http_stats(self):
+        """Print HTTP transfer, connection reuse and page cache counters."""
+        stats = self.http_client.get_stats()
+        print(f"HTTP: {stats['requests']} requests, {stats['bytes_downloaded'] / 1024:.1f} KiB downloaded, "
+              f"{stats['connections_reused']} reused connections, {stats['not_modified']} not modified (304)")
+        print(f"City URL cache: {self.url_resolver.stats['resolved']} resolved, "
+              f"{self.url_resolver.stats['skipped_missing']} known-missing skipped")
+        if self.page_cache:
+            cache_stats = self.page_cache.stats
+            print(f"Page cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                  f"{cache_stats['expired']} expired, {cache_stats['evicted']} evicted")
 
     def _generate_filename(self, letter_range):
         """Auto-generate filename based on letter range."""
@@ -105,6 +286,9 @@ class CostOfLivingScraper:
         
         print(f"Processing {len(countries_to_process)} countries...\n")
         
+        if self.max_concurrency > 1 or self.parse_workers:
+            return self._merge_data_concurrently(sorted(countries_to_process), country_city_dict)
+        
         # Process countries alphabetically
         for i, country in enumerate(sorted(countries_to_process), 1):
             print(f"[{i}/{len(countries_to_process)}] {country}")
@@ -113,13 +297,18 @@ class CostOfLivingScraper:
             country_url = UrlFormatter.country_url(country_clean)
             
             # Download country average
-            success = self._fetch_location_data(country_url, country_clean)
-            print(f"    {'✓' if success else '✗'} Average")
+            if self._is_done(country_clean, "average"):
+                print("    ✓ Average (checkpoint)")
+            else:
+                success = self._fetch_location_data(country_url, country_clean)
+                print(f"    {'✓' if success else '✗'} Average")
             
             # Download cities if specified
             if country_city_dict and country in country_city_dict:
                 for city in sorted(country_city_dict[country]):
-                    if self._fetch_city_data(city, country_clean):
+                    if self._is_done(country_clean, city):
+                        print(f"    ✓ {city} (checkpoint)")
+                    elif self._fetch_city_data(city, country_clean):
                         print(f"    ✓ {city}")
                     else:
                         self.missing_data.append(f"{city}, {country_clean}")
@@ -127,6 +316,92 @@ class CostOfLivingScraper:
         
         return self.data_processor.data
 
+    def _merge_data_concurrently(self, countries, country_city_dict):
+        """Fetch (and optionally parse) all locations concurrently, adding records in alphabetical order."""
+        locations = []
+        for country in countries:
+            country_clean = UrlFormatter.clean_name(country)
+            locations.append((country_clean, "average"))
+            if country_city_dict and country in country_city_dict:
+                locations.extend((country_clean, city) for city in sorted(country_city_dict[country]))
+        
+        skipped = sum(self._is_done(country, city) for country, city in locations)
+        if skipped:
+            print(f"Skipping {skipped} locations completed in a previous run.")
+        locations = [(country, city) for country, city in locations if not self._is_done(country, city)]
+        
+        # Results arrive out of order; hold them until every earlier location is in
+        pending = {}
+        next_index = 0
+        
+        def on_result(index, result):
+            nonlocal next_index
+            country, city = locations[index]
+            label = "Average" if city == "average" else city
+            print(f"    {'✓' if result else '✗'} {country}: {label}")
+            pending[index] = result
+            while next_index in pending:
+                result = pending.pop(next_index)
+                country, city = locations[next_index]
+                if result:
+                    self._add_record(country, city, result)
+                elif city != "average":
+                    self.missing_data.append(f"{city}, {country}")
+                next_index += 1
+        
+        if self.parse_workers:
+            self._run_parse_pipeline(locations, on_result)
+            return self.data_processor.data
+        
+        jobs = []
+        for country, city in locations:
+            if city == "average":
+                jobs.append(partial(self._download_location, UrlFormatter.country_url(country)))
+            else:
+                jobs.append(partial(self._download_city, city, country))
+        
+        print(f"Fetching {len(jobs)} locations with up to {self.max_concurrency} requests in flight...")
+        AsyncFetcher(self.max_concurrency).run(jobs, on_result=on_result)
+        
+        return self.data_processor.data
+    
+    def _fetch_for_pipeline(self, url):
+        """Fetch stage: return HTML to parse, a reused result on 304, or None."""
+        html = self._get_html(url, conditional=self.conditional and url in self.parsed_pages)
+        if html is self.NOT_MODIFIED:
+            self.metrics.count('parse_skipped_not_modified')
+            return tuple(self.parsed_pages[url])
+        return html
+    
+    def _run_parse_pipeline(self, locations, on_result):
+        """Fetch pages in threads and parse them in worker processes."""
+        candidates = []
+        for country, city in locations:
+            if city == "average":
+                candidates.append([(None, UrlFormatter.country_url(country))])
+            else:
+                candidates.append(self.url_resolver.candidate_urls(city, country))
+        
+        def on_parsed(index, url, result):
+            country, city = locations[index]
+            if result and self.conditional:
+                self.parsed_pages[url] = list(result)
+            if city != "average":
+                if result:
+                    pattern = next(pattern for pattern, candidate in candidates[index] if candidate == url)
+                    self.url_resolver.record_hit(city, country, pattern)
+                else:
+                    self._record_city_missing(city, country, candidates[index])
+            on_result(index, result)
+        
+        pipeline = ParsePipeline(self._fetch_for_pipeline, fetch_workers=self.max_concurrency,
+                                 parse_workers=self.parse_workers, parser_backend=self.parser_backend,
+                                 metrics=self.metrics)
+        print(f"Fetching {len(locations)} locations with {self.max_concurrency} fetch threads "
+              f"and {pipeline.parse_workers} parser processes...")
+        pipeline.run([[url for _, url in urls] for urls in candidates], on_parsed)
+        print("\n".join(pipeline.summary()))
+
     def _parse_range(self, range_str):
         """Parse range string into start/end letters."""
         range_str = range_str.upper().strip()
@@ -135,22 +410,45 @@ class CostOfLivingScraper:
             return start.strip(), end.strip()
         return range_str, range_str
 
+    def _download_city(self, city, country):
+        """Try to download city data using multiple URL formats."""
+        # City-country format first, city-only as fallback, unless a previous run found which one works
+        candidates = self.url_resolver.candidate_urls(city, country)
+        for pattern, url in candidates:
+            result = self._download_location(url)
+            if result:
+                self.url_resolver.record_hit(city, country, pattern)
+                return result
+        
+        self._record_city_missing(city, country, candidates)
+        return None
+    
+    def _record_city_missing(self, city, country, candidates):
+        """Remember a city as missing if every URL format was checked and none had data."""
+        if self.offline or not candidates:
+            return
+        if not any(url in self.transient_failures for _, url in candidates):
+            self.url_resolver.record_missing(city, country)
+    
     def _fetch_city_data(self, city, country):
         """Try to fetch city data using multiple URL formats."""
-        # Try city-country format first
-        city_url = UrlFormatter.city_url(city, country)
-        if self._fetch_location_data(city_url, country, city):
-            return True
+        result = self._download_city(city, country)
+        if not result:
+            return False
         
-        # Try city-only format as fallback
-        city_only_url = UrlFormatter.city_only_url(city)
-        return self._fetch_location_data(city_only_url, country, city)
+        self._add_record(country, city, result)
+        return True
     
     def save_data_to_parquet(self, filename='cost_of_living_data.parquet'):
         """Save collected data to Parquet file."""
         try:
-            df = self.data_processor.to_dataframe()
-            self.file_manager.save_parquet(df, filename)
+            if self.checkpoint:
+                self._save_checkpoint_to_parquet(filename)
+            elif self.dataset:
+                self.file_manager.save_dataset([self.data_processor.to_dataframe()])
+            else:
+                df = self.data_processor.to_dataframe()
+                self.file_manager.save_parquet(df, filename)
             
             if self.missing_data:
                 print(f"\nLocations with missing data: {', '.join(self.missing_data)}")
@@ -159,3 +457,13 @@ class CostOfLivingScraper:
         
         except Exception as e:
             print(f"Error saving data: {e}")
+    
+    def _save_checkpoint_to_parquet(self, filename):
+        """Stream the checkpoint journal into Parquet row groups with the final column order."""
+        self._flush_checkpoint()
+        frames = (self.data_processor.to_dataframe(chunk) for chunk in self.checkpoint.iter_records())
+        if self.dataset:
+            self.file_manager.save_dataset(frames)
+        elif not self.file_manager.save_parquet_chunks(frames, filename):
+            self.file_manager.save_parquet(self.data_processor.to_dataframe(), filename)
+        self.checkpoint.clear()
@@ -0,0 +1,44 @@
+import time
+from .url_formatter import UrlFormatter
+
+class UrlResolver:
+    """Remembers which URL format works for each city, or that a city has no page."""
+    
+    PATTERNS = {
+        'city_country': UrlFormatter.city_url,
+        'city_only': lambda city, country: UrlFormatter.city_only_url(city),
+    }
+    
+    def __init__(self, entries=None, negative_ttl=30 * 24 * 3600):
+        self.entries = entries or {}  # "country|city" -> {'pattern': name or None, 'checked_at': timestamp}
+        self.negative_ttl = negative_ttl
+        self.stats = {'resolved': 0, 'skipped_missing': 0}
+    
+    @staticmethod
+    def _key(city, country):
+        return f"{country}|{city}"
+    
+    def is_known_missing(self, city, country):
+        """True if the city had no page on a recent run."""
+        entry = self.entries.get(self._key(city, country))
+        return (entry is not None and entry['pattern'] is None
+                and time.time() - entry['checked_at'] < self.negative_ttl)
+    
+    def candidate_urls(self, city, country):
+        """Return (pattern, url) pairs to try in order; empty if the city is known to be missing."""
+        if self.is_known_missing(city, country):
+            self.stats['skipped_missing'] += 1
+            return []
+        order = list(self.PATTERNS)
+        entry = self.entries.get(self._key(city, country))
+        if entry and entry['pattern'] in self.PATTERNS:
+            self.stats['resolved'] += 1
+            order.remove(entry['pattern'])
+            order.insert(0, entry['pattern'])
+        return [(pattern, self.PATTERNS[pattern](city, country)) for pattern in order]
+    
+    def record_hit(self, city, country, pattern):
+        self.entries[self._key(city, country)] = {'pattern': pattern, 'checked_at': time.time()}
+    
+    def record_missing(self, city, country):
+        self.entries[self._key(city, country)] = {'pattern': None, 'checked_at': time.time()}
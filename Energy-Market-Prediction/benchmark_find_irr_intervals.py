@@ -0,0 +1,62 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import polars as pl
+from src.DataProcessor import DataProcessor
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark gap detection and calendar reindexing in DataProcessor.find_irr_intervals')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Number of rows before gaps are cut out (default: 1,000,000)')
+    parser.add_argument('--minutes', type=int, default=15, help='Sampling interval in minutes (default: 15)')
+    parser.add_argument('--gap_share', type=float, default=0.02, help='Share of rows removed to create gaps (default: 0.02)')
+    parser.add_argument('--legacy', action='store_true', help='Also time the previous row-by-row scan (slow)')
+    return parser.parse_args()
+
+def make_data(rows, interval, gap_share, seed=42):
+    rng = np.random.default_rng(seed)
+    datetimes = pl.datetime_range(datetime(2014, 1, 1), datetime(2014, 1, 1) + interval * (rows - 1), interval, eager=True)
+    df = pl.DataFrame({
+        'datetime': datetimes.cast(pl.Datetime('ns')),
+        'nuclear_forecast__mwh': rng.normal(1400, 50, rows),
+        'imbalance_price__eur_per_mwh': rng.normal(60, 20, rows)
+    })
+    # Single missing rows plus a few multi-day outages
+    keep = rng.random(rows) >= gap_share
+    for start in rng.integers(0, rows, 20):
+        keep[start:start + rng.integers(10, 500)] = False
+    keep[0] = keep[-1] = True
+    return df.filter(pl.Series(keep))
+
+def legacy_scan(df, interval):
+    step = interval.total_seconds()
+    irregular_intervals = []
+    previous_time = df['datetime'][0]
+    for i in range(1, df.shape[0]):
+        current_time = df['datetime'][i]
+        delta = (current_time - previous_time).total_seconds() / step
+        if delta != 1:
+            irregular_intervals.append((i-1, i, previous_time, current_time, delta - 1))
+        previous_time = current_time
+    return irregular_intervals
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    interval = timedelta(minutes=args.minutes)
+    df = make_data(args.rows, interval, args.gap_share)
+    print(f"{df.shape[0]:,} rows at {args.minutes}-minute resolution, {args.rows - df.shape[0]:,} missing")
+
+    processor = DataProcessor(df, None)
+    start = time.perf_counter()
+    gap_report = processor.find_irr_intervals(interval)
+    reindexed = processor.df.collect()
+    elapsed = time.perf_counter() - start
+    print(f"find_irr_intervals: {elapsed:.3f}s, {gap_report.shape[0]:,} gaps, {reindexed.shape[0]:,} rows after reindexing")
+    print(gap_report.sort('length', descending=True).head(5))
+
+    if args.legacy:
+        start = time.perf_counter()
+        irregular_intervals = legacy_scan(df, interval)
+        legacy_elapsed = time.perf_counter() - start
+        print(f"row-by-row scan: {legacy_elapsed:.3f}s ({legacy_elapsed / elapsed:.0f}x slower)")
+        assert gap_report['length'].to_list() == [int(gap[4]) for gap in irregular_intervals], "gap reports differ"
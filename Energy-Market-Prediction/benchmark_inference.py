@@ -0,0 +1,71 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+import polars as pl
+from src.ModelService import ModelService, make_server
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark single-hour and batch inference latency of a saved model artifact')
+    parser.add_argument('--model', type=str, default='output/models', help='Artifact directory, or a models directory to use its latest version (default: output/models)')
+    parser.add_argument('--requests', type=int, default=1000, help='Number of timed requests per scenario (default: 1000)')
+    parser.add_argument('--batch', type=int, default=24, help='Hours per batch request (default: 24)')
+    parser.add_argument('--http', action='store_true', help='Also time requests through the local HTTP server')
+    return parser.parse_args()
+
+def make_hours(service, n_hours):
+    # Replays the base rows of the rolling state shifted forward, so inputs have realistic values
+    state = pl.read_parquet(service.artifact_dir + '/feature_state/tail.parquet').select(service.input_columns)
+    rows = pl.concat([state] * (n_hours // len(state) + 1)).head(n_hours)
+    start = service.engineer.state_end + timedelta(hours=1)
+    return rows.with_columns(pl.datetime_range(start, start + timedelta(hours=n_hours - 1), '1h', eager=True)
+                             .cast(state.schema['datetime']).alias('datetime'))
+
+def report(name, latencies):
+    latencies = np.array(latencies) * 1000
+    print(f"{name:<28} p50 {np.percentile(latencies, 50):7.2f} ms   p99 {np.percentile(latencies, 99):7.2f} ms   max {latencies.max():7.2f} ms")
+
+def time_in_process(service, hours, size, n_requests):
+    latencies = []
+    for i in range(n_requests):
+        start = time.perf_counter()
+        service.predict(hours[i * size:(i + 1) * size])
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def time_http(service, hours, size, n_requests):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+    payloads = [json.dumps({'rows': hours[i * size:(i + 1) * size].with_columns(pl.col('datetime').dt.to_string()).to_dicts()})
+                for i in range(n_requests)]
+    latencies = []
+    for payload in payloads:
+        start = time.perf_counter()
+        connection.request('POST', '/predict', payload, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        body = response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            raise RuntimeError(body.decode())
+    connection.close()
+    server.shutdown()
+    return latencies
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    start = time.perf_counter()
+    service = ModelService(args.model)
+    print(f"Loaded model {service.version} in {time.perf_counter() - start:.2f}s ({len(service.feature_cols)} features)")
+    scenarios = [('single hour', 1), (f'batch of {args.batch} hours', args.batch)]
+    for name, size in scenarios:
+        hours = make_hours(service, size * args.requests)
+        # Warm-up, then time consecutive requests that each advance the rolling state
+        service.predict(hours[:size], advance=False)
+        report(name, time_in_process(service, hours, size, args.requests))
+        if args.http:
+            hours = make_hours(service, size * args.requests)
+            report(f"{name} (HTTP)", time_http(service, hours, size, args.requests))
@@ -1,16 +1,54 @@
 import argparse
 import os
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 import polars as pl
 from src.DataPlotter import DataPlotter
 from src.DataProcessor import DataProcessor
 from src.FeatureEngineer import FeatureEngineer
+from src.FeatureSelector import FeatureSelector
 from src.Predictor import Predictor
+from src.StageCache import StageCache
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Axpo coding challenge: capturing the price spread between day-ahead and balancing markets in area A')
     parser.add_argument('--n_trials', type=int, default=2,help='Number of iterations for XGBoost (default:2)')
+    parser.add_argument('--study_workers', type=int, default=1, help='Number of worker processes running Optuna trials in parallel (default: 1)')
+    parser.add_argument('--study_storage', type=str, default=None, help='Persist the Optuna study to this file (.db/.sqlite for SQLite, otherwise a journal file) so an interrupted study resumes; defaults to output/optuna_study.log when --study_workers > 1')
+    parser.add_argument('--study_name', type=str, default='imbalance_price', help='Name of the persisted Optuna study (default: imbalance_price)')
+    parser.add_argument('--prune', action='store_true', help='Prune unpromising trials early based on intermediate validation PNL')
+    parser.add_argument('--walk_forward', action='store_true', help='Run a walk-forward retraining backtest instead of the single train/validation/test split')
+    parser.add_argument('--wf_start', type=str, default='2024-01-01', help='First day traded in the walk-forward backtest (default: 2024-01-01)')
+    parser.add_argument('--wf_end', type=str, default='2024-08-30', help='End of the walk-forward backtest (default: 2024-08-30)')
+    parser.add_argument('--wf_train_days', type=int, default=180, help='Length of the sliding training window in days (default: 180)')
+    parser.add_argument('--wf_step_days', type=int, default=1, help='Days between retrains, i.e. length of each traded window (default: 1)')
+    parser.add_argument('--wf_update_rounds', type=int, default=20, help='Trees added per warm-started retrain (default: 20)')
+    parser.add_argument('--wf_refit_every', type=int, default=30, help='Full refit every N warm-started folds, 0 for never (default: 30)')
+    parser.add_argument('--no_warm_start', action='store_true', help='Refit every walk-forward fold from scratch instead of continuing the previous booster')
+    parser.add_argument('--wf_workers', type=int, default=1, help='Number of fold chains run in parallel processes (default: 1)')
+    parser.add_argument('--quantile', action='store_true', help='Train P10/P50/P90 models for several horizons and backtest quantile-spread sizing instead of the single model')
+    parser.add_argument('--horizons', type=str, default='1-24', help="Forecast horizons in hours for --quantile, e.g. '1-24' or '1,6,12,24' (default: 1-24)")
+    parser.add_argument('--quantile_workers', type=int, default=None, help='Quantile models trained concurrently, each with cores / workers XGBoost threads (default: number of cores)')
+    parser.add_argument('--imputation', choices=['full', 'window'], default='full', help='Fit STL on the full history of each column or only on a window around each gap (default: full)')
+    parser.add_argument('--stl_window', type=int, default=24*28, help='Hours of context on each side of a gap in window imputation (default: 672)')
+    parser.add_argument('--incremental_features', action='store_true', help='Compute features only for hours appended since the previous run, from the rolling state in data/feature_state')
+    parser.add_argument('--stl_cache', action='store_true', help='Reuse STL imputations of unchanged segments from data/stl_cache')
+    parser.add_argument('--no_stage_cache', action='store_true', help='Recompute imputation and features instead of reusing the Arrow files in data/stage_cache')
+    parser.add_argument('--select_features', action='store_true', help='Drop collinear and low-importance engineered columns before training; the chosen list is written to output/selected_features.json')
+    parser.add_argument('--corr_threshold', type=float, default=0.95, help='Absolute correlation above which the less important column of a pair is dropped (default: 0.95)')
+    parser.add_argument('--min_importance', type=float, default=0.0001, help='Minimum share of the proxy model gain a column needs to be kept (default: 0.0001)')
+    parser.add_argument('--selection_end', type=str, default='2023-07-01', help='Only rows before this date are used to select features (default: 2023-07-01, the validation start)')
+    parser.add_argument('--plot_workers', type=int, default=1, help='Number of worker processes rendering figures in the background (default: 1, render inline)')
+    parser.add_argument('--plot_downsample', choices=['minmax', 'lttb', 'none'], default='minmax', help='Downsample long series to the figure width before drawing (default: minmax)')
+    parser.add_argument('--corr_cluster', action='store_true', help='Order the correlation heatmap by hierarchical clustering of the columns')
     return parser.parse_args()
 
+def print_peak_rss(stage):
+    if resource is not None:
+        print(f"Peak RSS after {stage}: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
 if __name__ == "__main__":
     # Reading arguments
     args = parse_arguments()
@@ -19,18 +57,39 @@ if __name__ == "__main__":
     
     # Processing the data (identification of outliers and data imputation)
     print("======> Data processing")
-    df = pl.read_parquet(args.current_dir + '/data/master_table.parquet')
+    input_path = args.current_dir + '/data/master_table.parquet'
+    # Stage outputs keyed by the input file hash and stage settings, memory-mapped when reused
+    stage_cache = None if args.no_stage_cache else StageCache(os.path.join(args.current_dir, 'data', 'stage_cache'))
+    df = pl.scan_parquet(input_path)
     processor = DataProcessor(df, args)
-    imputed_df, _ = processor.process_data()
+    imputed_df, _ = processor.process_data(stage_cache, StageCache.file_hash(input_path) if stage_cache else None)
+    print_peak_rss("data processing")
 
     # Feature engineering
     print("======> Feature engineering")
-    engineer = FeatureEngineer(args, imputed_df)
+    engineer = FeatureEngineer(args, imputed_df, incremental=args.incremental_features,
+                               stage_cache=stage_cache, input_key=processor.cache_key)
     processed_dataset = engineer.preprocessed_data
+    print_peak_rss("feature engineering")
     
+    # Feature selection
+    selected_features = None
+    if args.select_features:
+        print("======> Feature selection")
+        selected_features = FeatureSelector(args, processed_dataset).selected_features
+
     # Predictor
     print("======> Model building")
-    predict = Predictor(args, processed_dataset)
-    predict.run_predictor()
+    predict = Predictor(args, processed_dataset, selected_features)
+    if args.walk_forward:
+        predict.run_walk_forward()
+    elif args.quantile:
+        predict.run_quantile()
+    else:
+        predict.run_predictor()
+        print(f"Model artifact saved to {predict.save_model_artifact(engineer)}")
+    print_peak_rss("model building")
+    # Figures of the data processing stage may still be rendering in the background
+    processor.plotter.wait()
 
     print("Finished. Thank you for your patience :)")
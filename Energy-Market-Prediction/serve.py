@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+from src.ModelService import ModelService, make_server
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Score new hours with a saved model artifact, over HTTP or once from a JSON file')
+    parser.add_argument('--model', type=str, default='output/models', help='Artifact directory, or a models directory to use its latest version (default: output/models)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--input', type=str, default=None, help='Score the rows in this JSON file ("-" for stdin) and print the predictions instead of serving')
+    parser.add_argument('--no_advance', action='store_true', help='With --input, do not append the scored hours to the rolling state')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    service = ModelService(args.model)
+    if args.input:
+        with (sys.stdin if args.input == '-' else open(args.input)) as f:
+            payload = json.load(f)
+        rows = payload['rows'] if isinstance(payload, dict) else payload
+        print(json.dumps(service.predict_records(rows, advance=not args.no_advance), indent=2))
+    else:
+        server = make_server(service, args.host, args.port)
+        print(f"Serving model {service.version} (state ends {service.health()['state_end']}) on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
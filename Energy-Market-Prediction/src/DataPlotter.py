@@ -1,114 +1,268 @@
 # DataPlotter
 
+import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
+import polars as pl
 import matplotlib.dates as mdates
+from matplotlib import cbook
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
 
 class DataPlotter:
+    """
+    Prepares plot data in the calling process (downsampled series, box statistics, correlation matrix)
+    and draws the figures inline or, with plot_workers > 1, in worker processes on the Agg backend.
+    """
     def __init__(self, args):
         self.output_filepath = args.output_filepath
+        self.plot_workers = getattr(args, 'plot_workers', 1)
+        # 'minmax' keeps the extremes of every pixel column, 'lttb' the visually largest triangles, 'none' every point
+        self.downsample = getattr(args, 'plot_downsample', 'minmax')
+        self.corr_cluster = getattr(args, 'corr_cluster', False)
+        self.corr_matrix = None
+        self._executor = None
+        self._futures = []
+
+    def _render(self, draw, *payload):
+        if self.plot_workers > 1:
+            if self._executor is None:
+                # spawn, not fork: a forked child can deadlock on the polars thread pool of the parent
+                self._executor = ProcessPoolExecutor(self.plot_workers, mp_context=get_context('spawn'), initializer=_use_agg)
+            self._futures.append(self._executor.submit(draw, *payload))
+        else:
+            draw(*payload)
+
+    def wait(self):
+        """
+        Block until every figure submitted to the worker processes is written.
+        """
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _series(self, x, y, width_in):
+        n_out = int(width_in * _dpi())
+        if self.downsample == 'lttb' and not np.isnan(y).any():
+            return lttb_downsample(x, y, n_out)
+        if self.downsample in ('minmax', 'lttb'):
+            return minmax_downsample(x, y, n_out)
+        return x, y
 
     def plot_outliers(self, df, n_cols=3):
         columns_to_plot = df.columns[1:]
-        n_rows = (len(columns_to_plot) - 1) // n_cols + 1
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(5*n_cols, 4*n_rows), squeeze=False)
-        axes = axes.flatten()
-        for i, col in enumerate(columns_to_plot):
-            ax = axes[i]
-            ax.boxplot(df[col], tick_labels=[col])
-            # ax.set_yscale('symlog')
-            ax.set_title(f'{col}')
-            ax.set_ylabel('Values')
-            ax.grid(True, alpha=0.2)
-        for j in range(i+1, len(axes)):
-            fig.delaxes(axes[j])
-        plt.tight_layout()
-        plt.savefig(self.output_filepath + '/outliers.png', bbox_inches='tight')
-        plt.close(fig)
+        # Only the box statistics and fliers go to the renderer, not the rows
+        stats = [cbook.boxplot_stats(df[col].drop_nulls().drop_nans().to_numpy(), labels=[col])[0] for col in columns_to_plot]
+        self._render(_draw_outliers, self.output_filepath + '/outliers.png', stats, list(columns_to_plot), n_cols)
 
     def plot_imputed_data(self, df, imputed_indices, columns, start_date='2024-06-13 23', end_date='2024-06-28'):
-        num_cols = len(columns)
-        fig, axes = plt.subplots(num_cols, 1, figsize=(12, 6 * num_cols), sharex=True)
-        for i, col in enumerate(columns):
-            ax = axes[i] if num_cols > 1 else axes
-            ax.step(df.index, df[col], where='post', color='blue', label='Original data')
-            imputed_data = df[col].copy()
-            imputed_data[~df.index.isin(imputed_indices[col])] = None
-            ax.step(df.index, imputed_data, where='post', color='red', label='Imputed data')
-            ax.set_xlim(pd.to_datetime(start_date), pd.to_datetime(end_date))
-            ax.legend()
-            ax.set_title(col)
-        plt.tight_layout()
-        plt.savefig(self.output_filepath + '/imputed_data.png', bbox_inches='tight')
-        plt.close(fig)
+        start, end = pd.to_datetime(start_date), pd.to_datetime(end_date)
+        # Only the visible window is drawn; one row either side keeps the steps running to the axis edges
+        datetimes = df['datetime'].to_numpy()
+        first = max(np.searchsorted(datetimes, np.datetime64(start), side='right') - 1, 0)
+        last = np.searchsorted(datetimes, np.datetime64(end), side='left') + 1
+        x = datetimes[first:last]
+        series = []
+        for col in columns:
+            y = df[col].to_numpy()[first:last].astype(np.float64)
+            y_imputed = np.where(np.isin(x, imputed_indices[col]), y, np.nan)
+            series.append((col, *self._series(x, y, 12), *self._series(x, y_imputed, 12)))
+        self._render(_draw_imputed_data, self.output_filepath + '/imputed_data.png', series, start, end)
+
+    @staticmethod
+    def correlation_matrix(full_dataset, cluster=False):
+        """
+        Pearson correlation of all columns but the first, as one float32 matrix product over standardized columns.
+        With cluster, columns are reordered by hierarchical clustering on 1 - |correlation|.
+        """
+        columns = full_dataset.columns[1:]
+        X = full_dataset.select(pl.col(columns).cast(pl.Float32)).to_numpy()
+        X = X - X.mean(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            X /= np.sqrt((X * X).sum(axis=0))
+            corr = np.clip(X.T @ X, -1, 1)
+        if cluster:
+            from scipy.cluster.hierarchy import leaves_list, linkage
+            from scipy.spatial.distance import squareform
+            distance = 1 - np.abs(np.nan_to_num(corr, nan=0.0))
+            np.fill_diagonal(distance, 0)
+            order = leaves_list(linkage(squareform(distance.astype(np.float64), checks=False), method='average'))
+            corr = corr[np.ix_(order, order)]
+            columns = [columns[i] for i in order]
+        return corr, list(columns)
 
     def corr_plot(self, full_dataset):
-        correlation_matrix_polars = full_dataset[:,1:].corr()
-        correlation_matrix_pandas = correlation_matrix_polars.to_pandas()
-        columns = full_dataset[:, 1:].columns
-        plt.figure(figsize=(30, 24))
-        sns.heatmap(correlation_matrix_pandas, annot=False, fmt=".2f", cmap='PiYG',
-                    square=True, linewidths=.5, cbar_kws={"shrink": .8},
-                    xticklabels=columns, yticklabels=columns)
-        plt.title('Full Correlation Matrix with Labels', fontsize=24)
-        plt.xticks(rotation=90)
-        plt.yticks(rotation=0)
-        plt.tight_layout()
-        plt.savefig(self.output_filepath + '/corr_plot.png', bbox_inches='tight')
-        plt.close()
-
-    def plot_combined_results(self, simplified_results, feature_importance_df):
-        df = simplified_results.to_pandas()
-        fig = plt.figure(figsize=(16, 24))
-        gs = fig.add_gridspec(4, 2)
-        ax1 = fig.add_subplot(gs[0, :])
-        ax2 = fig.add_subplot(gs[1, :])
-        ax3 = fig.add_subplot(gs[2, :])
-        ax4 = fig.add_subplot(gs[3, :])
-        # Plot 1: Time series of actual vs predicted values
-        ax1.plot(df['datetime'], df['imbalance_price__eur_per_mwh'], label='Actual', alpha=0.7)
-        ax1.plot(df['datetime'], df['predicted_balancing_price'], label='Predicted', alpha=0.7)
-        ax1.set_title('Actual vs Predicted Imbalance Price Over Time')
-        ax1.set_xlabel('Date')
-        ax1.set_ylabel('Price (EUR/MWh)')
-        ax1.legend()
-        ax1.grid(True)
-        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-        ax1.xaxis.set_major_locator(mdates.MonthLocator())
-        plt.setp(ax1.xaxis.get_majorticklabels(), rotation=45, ha='right')
-        # Plot 2: Scatter plot of actual vs predicted values
-        ax2.scatter(df['imbalance_price__eur_per_mwh'], df['predicted_balancing_price'], alpha=0.5)
-        ax2.set_title('Actual vs Predicted Imbalance Price')
-        ax2.set_xlabel('Actual Price (EUR/MWh)')
-        ax2.set_ylabel('Predicted Price (EUR/MWh)')
-        min_val = min(df['imbalance_price__eur_per_mwh'].min(), df['predicted_balancing_price'].min())
-        max_val = max(df['imbalance_price__eur_per_mwh'].max(), df['predicted_balancing_price'].max())
-        ax2.plot([min_val, max_val], [min_val, max_val], 'r--', label='Perfect Prediction')
-        ax2.legend()
-        ax2.grid(True)
-        # Plot 3: Top 20 features
-        top_n = 20
-        top_features = feature_importance_df.head(top_n)
-        y_pos = range(len(top_features['feature']))
-        ax3.barh(y_pos, top_features['importance'])
-        ax3.set_yticks(y_pos)
-        ax3.set_yticklabels(top_features['feature'])
-        ax3.set_xlabel('Feature Importance')
-        ax3.set_title('Top 20 Features')
-        ax3.invert_yaxis()
-        ax3.tick_params(axis='y', labelsize=8)
-        fig.canvas.draw()
-        ax3.set_ylim(ax3.get_ylim()[0] - 0.5, ax3.get_ylim()[1] + 0.5)
-        # Plot 4: Cumulative PNL
-        ax4.step(df['datetime'], df['PNL'].cumsum(), where='post', color='green')
-        ax4.set_title('Cumulative PNL Over Time')
-        ax4.set_xlabel('Date')
-        ax4.set_ylabel('Cumulative PNL')
-        ax4.grid(True)
-        ax4.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-        ax4.xaxis.set_major_locator(mdates.MonthLocator())
-        plt.setp(ax4.xaxis.get_majorticklabels(), rotation=45, ha='right')
-        plt.tight_layout(pad=1.0, h_pad=1.0)
-        plt.savefig(self.output_filepath + '/final_output.png', bbox_inches='tight')
-        plt.close(fig)
+        corr, columns = self.correlation_matrix(full_dataset, self.corr_cluster)
+        self.corr_matrix = pd.DataFrame(corr, index=columns, columns=columns)
+        self._render(_draw_corr, self.output_filepath + '/corr_plot.png', corr, columns)
+
+    def plot_combined_results(self, simplified_results, feature_importance_df, scatter_points=20000):
+        x = simplified_results['datetime'].to_numpy()
+        actual = simplified_results['imbalance_price__eur_per_mwh'].to_numpy()
+        predicted = simplified_results['predicted_balancing_price'].to_numpy()
+        cumulative_pnl = simplified_results['PNL'].cum_sum().to_numpy()
+        # Every point in the scatter is drawn, so long results are thinned evenly
+        step = max(len(actual) // scatter_points, 1)
+        limits = (min(np.nanmin(actual), np.nanmin(predicted)), max(np.nanmax(actual), np.nanmax(predicted)))
+        top_features = feature_importance_df.head(20)
+        self._render(_draw_combined_results, self.output_filepath + '/final_output.png',
+                     self._series(x, actual, 16), self._series(x, predicted, 16),
+                     (actual[::step], predicted[::step]), limits,
+                     (list(top_features['feature']), np.asarray(top_features['importance'])),
+                     self._series(x, cumulative_pnl, 16))
+
+def _dpi():
+    dpi = plt.rcParams['savefig.dpi']
+    return plt.rcParams['figure.dpi'] if dpi == 'figure' else dpi
+
+def minmax_downsample(x, y, n_buckets):
+    """
+    Keep the first, last, minimum and maximum point of each of n_buckets equal buckets, in order.
+    All-NaN buckets keep one NaN point, so gaps stay visible.
+    """
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return x, y
+    size = -(-n // n_buckets)
+    padded = np.full(size * -(-n // size), np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(-1, size)
+    offsets = np.arange(len(buckets)) * size
+    with np.errstate(invalid='ignore'):
+        low = np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=1) + offsets
+        high = np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=1) + offsets
+    index = np.unique(np.concatenate([[0, n - 1], low, high]))
+    index = index[index < n]
+    return x[index], y[index]
+
+def lttb_downsample(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: per bucket, keep the point spanning the largest triangle with the
+    previously kept point and the mean of the next bucket.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+    t = x.astype('datetime64[ns]').astype(np.int64).astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    means_t = np.add.reduceat(t[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    means_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    index = np.empty(n_out, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_t, next_y = (means_t[i + 1], means_y[i + 1]) if i + 1 < len(means_t) else (t[-1], y[-1])
+        area = np.abs((t[previous] - next_t) * (y[start:stop] - y[previous]) -
+                      (t[previous] - t[start:stop]) * (next_y - y[previous]))
+        previous = start + int(area.argmax())
+        index[i + 1] = previous
+    return x[index], y[index]
+
+def _month_locator(x, max_ticks=24):
+    # Monthly ticks, spaced out on multi-year series so tick label layout stays bounded
+    months = int((x[-1] - x[0]) / np.timedelta64(30, 'D')) + 1
+    return mdates.MonthLocator(interval=max(1, -(-months // max_ticks)))
+
+def _use_agg():
+    matplotlib.use('Agg')
+
+def _draw_outliers(path, stats, columns_to_plot, n_cols):
+    n_rows = (len(columns_to_plot) - 1) // n_cols + 1
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(5*n_cols, 4*n_rows), squeeze=False)
+    axes = axes.flatten()
+    for i, (col, col_stats) in enumerate(zip(columns_to_plot, stats)):
+        ax = axes[i]
+        ax.bxp([col_stats])
+        # ax.set_yscale('symlog')
+        ax.set_title(f'{col}')
+        ax.set_ylabel('Values')
+        ax.grid(True, alpha=0.2)
+    for j in range(i+1, len(axes)):
+        fig.delaxes(axes[j])
+    plt.tight_layout()
+    plt.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+
+def _draw_imputed_data(path, series, start_date, end_date):
+    num_cols = len(series)
+    fig, axes = plt.subplots(num_cols, 1, figsize=(12, 6 * num_cols), sharex=True)
+    for i, (col, x, y, x_imputed, y_imputed) in enumerate(series):
+        ax = axes[i] if num_cols > 1 else axes
+        ax.step(x, y, where='post', color='blue', label='Original data')
+        ax.step(x_imputed, y_imputed, where='post', color='red', label='Imputed data')
+        ax.set_xlim(start_date, end_date)
+        ax.legend()
+        ax.set_title(col)
+    plt.tight_layout()
+    plt.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+
+def _draw_corr(path, corr, columns):
+    # One image instead of a grid of bordered cells; the figure scales with the number of columns
+    size = min(max(8, 0.22 * len(columns)), 30)
+    fig, ax = plt.subplots(figsize=(size * 1.25, size))
+    image = ax.imshow(corr, cmap='PiYG', vmin=-1, vmax=1, interpolation='nearest')
+    fig.colorbar(image, ax=ax, shrink=.8)
+    ax.set_xticks(range(len(columns)), columns, rotation=90)
+    ax.set_yticks(range(len(columns)), columns)
+    ax.tick_params(labelsize=8)
+    ax.set_title('Full Correlation Matrix with Labels', fontsize=24)
+    plt.tight_layout()
+    plt.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+
+def _draw_combined_results(path, actual, predicted, scatter, limits, top_features, cumulative_pnl):
+    fig = plt.figure(figsize=(16, 24))
+    gs = fig.add_gridspec(4, 2)
+    ax1 = fig.add_subplot(gs[0, :])
+    ax2 = fig.add_subplot(gs[1, :])
+    ax3 = fig.add_subplot(gs[2, :])
+    ax4 = fig.add_subplot(gs[3, :])
+    # Plot 1: Time series of actual vs predicted values
+    ax1.plot(*actual, label='Actual', alpha=0.7)
+    ax1.plot(*predicted, label='Predicted', alpha=0.7)
+    ax1.set_title('Actual vs Predicted Imbalance Price Over Time')
+    ax1.set_xlabel('Date')
+    ax1.set_ylabel('Price (EUR/MWh)')
+    ax1.legend()
+    ax1.grid(True)
+    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax1.xaxis.set_major_locator(_month_locator(actual[0]))
+    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=45, ha='right')
+    # Plot 2: Scatter plot of actual vs predicted values
+    ax2.scatter(*scatter, alpha=0.5)
+    ax2.set_title('Actual vs Predicted Imbalance Price')
+    ax2.set_xlabel('Actual Price (EUR/MWh)')
+    ax2.set_ylabel('Predicted Price (EUR/MWh)')
+    min_val, max_val = limits
+    ax2.plot([min_val, max_val], [min_val, max_val], 'r--', label='Perfect Prediction')
+    ax2.legend()
+    ax2.grid(True)
+    # Plot 3: Top 20 features
+    features, importances = top_features
+    y_pos = range(len(features))
+    ax3.barh(y_pos, importances)
+    ax3.set_yticks(y_pos)
+    ax3.set_yticklabels(features)
+    ax3.set_xlabel('Feature Importance')
+    ax3.set_title('Top 20 Features')
+    ax3.invert_yaxis()
+    ax3.tick_params(axis='y', labelsize=8)
+    ax3.set_ylim(ax3.get_ylim()[0] - 0.5, ax3.get_ylim()[1] + 0.5)
+    # Plot 4: Cumulative PNL
+    ax4.step(*cumulative_pnl, where='post', color='green')
+    ax4.set_title('Cumulative PNL Over Time')
+    ax4.set_xlabel('Date')
+    ax4.set_ylabel('Cumulative PNL')
+    ax4.grid(True)
+    ax4.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax4.xaxis.set_major_locator(_month_locator(cumulative_pnl[0]))
+    plt.setp(ax4.xaxis.get_majorticklabels(), rotation=45, ha='right')
+    plt.tight_layout(pad=1.0, h_pad=1.0)
+    plt.savefig(path, bbox_inches='tight')
+    plt.close(fig)
@@ -5,20 +5,33 @@ import polars as pl
 from datetime import timedelta
 import pandas as pd
 from statsmodels.tsa.seasonal import STL
-import matplotlib.pyplot as plt
-from multiprocessing import Pool
-from functools import partial
+import os
+import hashlib
+import numpy as np
+from multiprocessing import Pool, shared_memory
 
 # Import custom library
 from src.DataPlotter import DataPlotter
 
 class DataProcessor:
+    STL_PARAMS = dict(seasonal=25, period=24, trend=169, low_pass=169,
+                      seasonal_deg=1, trend_deg=1, low_pass_deg=1, robust=True)
+
     def __init__(self, df, args):
-        self.df = df
+        # Kept as a LazyFrame until the STL step, so only the columns the plan needs are read
+        self.df = df.lazy()
         self.args = args
+        # 'full' fits STL on the whole history of a column, 'window' only around each gap cluster
+        self.imputation = getattr(args, 'imputation', 'full')
+        self.stl_window = getattr(args, 'stl_window', 24 * 28)
+        self.stl_cache_dir = None
+        self.cache_key = None
+        if getattr(args, 'stl_cache', False):
+            self.stl_cache_dir = os.path.join(args.current_dir, 'data', 'stl_cache')
+            os.makedirs(self.stl_cache_dir, exist_ok=True)
 
     def replace_hydro_outlier(self):
-        next_highest = self.df.filter(pl.col('hydro_forecast__mwh__neighbors') < 50_000).select(pl.col('hydro_forecast__mwh__neighbors').max()).item()
+        next_highest = pl.col('hydro_forecast__mwh__neighbors').filter(pl.col('hydro_forecast__mwh__neighbors') < 50_000).max()
         self.df = self.df.with_columns(
             pl.when(pl.col('hydro_forecast__mwh__neighbors') >= 50_000)
             .then(next_highest)
@@ -26,72 +39,167 @@ class DataProcessor:
             .alias('hydro_forecast__mwh__neighbors')
         )
 
-    def find_irr_intervals(self):
-        start_datetime = self.df['datetime'].min()
-        end_datetime = self.df['datetime'].max()
-        total_hours = int((end_datetime - start_datetime).total_seconds() // 3600)
-        full_datetime_range = pl.Series(
-            "datetime", 
-            [start_datetime + timedelta(hours=i) for i in range(total_hours + 1)] 
+    def find_irr_intervals(self, interval=timedelta(hours=1)):
+        self.df = self.df.sort('datetime')
+        step_ns = int(interval.total_seconds() * 1e9)
+        # Adding a timedelta moves the column to μs; start/end and the calendar keep the input's time unit
+        dtype = self.df.collect_schema()['datetime']
+        # One row per irregular step: start/end are the first/last missing timestamps, length the missing steps
+        self.gap_report = (
+            self.df.select(
+                pl.int_range(pl.len()).alias('index'),
+                pl.col('datetime'),
+                pl.col('datetime').diff().dt.total_nanoseconds().alias('delta')
+            )
+            .filter(pl.col('delta') != step_ns)
+            .select(
+                (pl.col('index') - 1).alias('start_index'),
+                (pl.col('datetime') - pl.col('delta').cast(pl.Duration('ns')) + interval).cast(dtype).alias('start'),
+                (pl.col('datetime') - interval).cast(dtype).alias('end'),
+                (pl.col('delta') // step_ns - 1).alias('length')
+            )
+            .collect(engine='in-memory')
+        )
+        full_range = self.df.select(
+            pl.datetime_range(pl.col('datetime').min(), pl.col('datetime').max(), interval).cast(dtype).alias('datetime')
         )
-        full_range_df = pl.DataFrame({
-            "datetime": full_datetime_range
-        }).with_columns(pl.col("datetime").cast(pl.Datetime("ns"))) 
-        irregular_intervals = []
-        previous_time = self.df['datetime'][0]
-        for i in range(1, self.df.shape[0]):
-            current_time = self.df['datetime'][i]
-            delta = (current_time - previous_time).total_seconds() / 3600  
-            if delta != 1: 
-                missing_hours = delta - 1 
-                irregular_intervals.append((i-1, i, previous_time, current_time, missing_hours))
-                #print(f"Irregular interval from index {i-1} to {i}: {previous_time} to {current_time}, gap: {missing_hours} hours")
-            previous_time = current_time
-        new_df = full_range_df.join(self.df, on="datetime", how="left")
-        missing_rows = new_df.filter(pl.col("nuclear_forecast__mwh").is_null())
-        #print(f"Total missing rows: {missing_rows.shape[0]}")
-        self.df = new_df.to_pandas().set_index('datetime').copy()
+        self.df = full_range.join(self.df, on="datetime", how="left", maintain_order='left')
+        #print(f"Irregular intervals: {self.gap_report.shape[0]}")
+        return self.gap_report
 
     @staticmethod
-    def impute_data_with_stl(df, col):
-        data = df.copy()
-        imputed_indices = data[data[col].isnull()].index
-        stl = STL(data[col].interpolate(),
-                  seasonal=25,
-                  period=24,
-                  trend=169,
-                  low_pass=169,
-                  seasonal_deg=1,
-                  trend_deg=1,
-                  low_pass_deg=1,
-                  robust=True)
+    def stl_impute_values(values):
+        series = pd.Series(values)
+        stl = STL(series.interpolate(), **DataProcessor.STL_PARAMS)
         res = stl.fit()
         seasonal_component = res.seasonal
-        df_deseasonalised = data[col] - seasonal_component
+        df_deseasonalised = series - seasonal_component
         df_deseasonalised_imputed = df_deseasonalised.interpolate(method="linear")
-        df_imputed = df_deseasonalised_imputed + seasonal_component
-        data.loc[imputed_indices, col] = df_imputed[imputed_indices]
-        return col, data[col], imputed_indices
-
-    def generate_stl_pred_parallel(self, columns, n_workers=7):
-        with Pool(n_workers) as pool:
-            results = pool.map(partial(self.impute_data_with_stl, self.df), columns)
-        imputed_df = self.df.copy()
-        imputed_indices = {}
-        for col, imputed_series, indices in results:
-            imputed_df[col] = imputed_series
-            imputed_indices[col] = indices
+        return (df_deseasonalised_imputed + seasonal_component).to_numpy()
+
+    def stl_segments(self, values):
+        missing = np.flatnonzero(np.isnan(values))
+        if len(missing) == 0:
+            return []
+        if self.imputation == 'full':
+            return [(0, len(values))]
+        # Gap clusters whose context windows touch or overlap are fitted together
+        segments = []
+        for start, stop in zip(np.maximum(missing - self.stl_window, 0), np.minimum(missing + self.stl_window + 1, len(values))):
+            if segments and start <= segments[-1][1]:
+                segments[-1][1] = stop
+            else:
+                segments.append([start, stop])
+        return [(int(start), int(stop)) for start, stop in segments]
+
+    def stl_cache_key(self, values):
+        key = hashlib.sha256(repr(sorted(self.STL_PARAMS.items())).encode())
+        key.update(np.ascontiguousarray(values).tobytes())
+        return key.hexdigest()
+
+    @staticmethod
+    def available_cores():
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+    def generate_stl_pred_parallel(self, columns, n_workers=None):
+        n_workers = n_workers or self.available_cores()
+        columns = [col for col in columns if col != 'datetime']
+        # Column-major matrix in shared memory: workers attach once and impute their segments in place
+        shm = shared_memory.SharedMemory(create=True, size=max(len(self.df) * len(columns) * 8, 1))
+        matrix = segment = None
+        try:
+            matrix = np.ndarray((len(self.df), len(columns)), dtype=np.float64, buffer=shm.buf, order='F')
+            matrix[:] = self.df.select(pl.col(columns).cast(pl.Float64)).to_numpy()
+            # Columns without gaps are skipped, segments seen on an earlier run are filled from the cache
+            imputed_indices = {col: np.flatnonzero(np.isnan(matrix[:, j])) for j, col in enumerate(columns)}
+            tasks, cached, keys = [], 0, {}
+            for j in range(len(columns)):
+                for start, stop in self.stl_segments(matrix[:, j]):
+                    segment = matrix[start:stop, j]
+                    if self.stl_cache_dir:
+                        keys[(j, start)] = self.stl_cache_key(segment)
+                        path = os.path.join(self.stl_cache_dir, keys[(j, start)] + '.npy')
+                        if os.path.exists(path):
+                            segment[np.isnan(segment)] = np.load(path)
+                            cached += 1
+                            continue
+                    tasks.append((j, start, stop))
+            if tasks:
+                with Pool(min(n_workers, len(tasks)), initializer=_attach_matrix, initargs=(shm.name, matrix.shape)) as pool:
+                    for j, start, filled in pool.imap_unordered(_impute_shared_segment, tasks):
+                        if self.stl_cache_dir:
+                            np.save(os.path.join(self.stl_cache_dir, keys[(j, start)] + '.npy'), filled)
+            print(f"STL imputation ({self.imputation}): {len(tasks)} segments fitted, {cached} from cache, "
+                  f"{sum(len(p) == 0 for p in imputed_indices.values())}/{len(columns)} columns without gaps skipped")
+            datetimes = self.df['datetime'].to_numpy()
+            imputed_df = self.df.with_columns([
+                pl.Series(col, matrix[:, j].copy(), nan_to_null=True)
+                for j, col in enumerate(columns) if len(imputed_indices[col])
+            ])
+            for col in columns:
+                imputed_indices[col] = datetimes[imputed_indices[col]]
+        finally:
+            # Views into the buffer have to go before it is closed, also when a worker raised
+            del matrix, segment
+            shm.close()
+            shm.unlink()
         return imputed_df, imputed_indices
 
-    def process_data(self):
+    def cache_config(self):
+        return {'imputation': self.imputation, 'stl_window': self.stl_window, 'stl_params': self.STL_PARAMS}
+
+    def _load_cached(self, stage_cache, key):
+        imputed_df = stage_cache.load('imputed', key)
+        indices = stage_cache.load('imputed_indices', key)
+        if imputed_df is None or indices is None:
+            return None
+        groups = indices.partition_by('column', as_dict=True, include_key=False)
+        empty = indices['datetime'].head(0).to_numpy()
+        imputed_indices = {col: groups[(col,)]['datetime'].to_numpy() if (col,) in groups else empty
+                           for col in imputed_df.columns if col != 'datetime'}
+        return imputed_df, imputed_indices
+
+    def process_data(self, stage_cache=None, input_hash=None):
         self.plotter = DataPlotter(self.args)
+        # Reuse the imputed frame of an earlier run on the same input file and settings (figures were written then)
+        if stage_cache is not None:
+            self.cache_key = stage_cache.key('imputed', input_hash, self.cache_config())
+            cached = self._load_cached(stage_cache, self.cache_key)
+            if cached is not None:
+                print("Imputed data loaded from the stage cache")
+                return cached
         self.replace_hydro_outlier()
         self.find_irr_intervals()
+        self.df = self.df.collect(engine='in-memory')
         
         columns_to_process = self.df.columns
         imputed_df, imputed_indices = self.generate_stl_pred_parallel(columns_to_process)
        
-        self.plotter.plot_outliers(self.df)
-        self.plotter.plot_imputed_data(imputed_df, imputed_indices, ['consumption_forecast__mwh'])
+        plot_columns = ['consumption_forecast__mwh']
+        self.plotter.plot_outliers(self.df.drop('datetime'))
+        self.plotter.plot_imputed_data(imputed_df, imputed_indices, plot_columns)
 
+        if stage_cache is not None:
+            stage_cache.save('imputed', self.cache_key, imputed_df)
+            stage_cache.save('imputed_indices', self.cache_key, pl.DataFrame({
+                'column': np.repeat(list(imputed_indices), [len(index) for index in imputed_indices.values()]),
+                'datetime': np.concatenate(list(imputed_indices.values()))
+            }))
         return imputed_df, imputed_indices
+
+# Worker-side view of the shared matrix, set once per process by the pool initializer
+_shared = {}
+
+def _attach_matrix(name, shape):
+    _shared['shm'] = shared_memory.SharedMemory(name=name)
+    _shared['matrix'] = np.ndarray(shape, dtype=np.float64, buffer=_shared['shm'].buf, order='F')
+
+def _impute_shared_segment(task):
+    j, start, stop = task
+    values = _shared['matrix'][start:stop, j]
+    missing = np.isnan(values)
+    filled = DataProcessor.stl_impute_values(values)[missing]
+    values[missing] = filled
+    return j, start, filled
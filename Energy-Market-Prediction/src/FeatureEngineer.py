@@ -1,14 +1,58 @@
+import os
+import json
+from functools import cached_property
 import polars as pl
 import numpy as np
 
 class FeatureEngineer:
-    def __init__(self, args, imputed_df):
-        self._imputed_data = pl.from_pandas(imputed_df.reset_index())
+    SMA_EMA_columns = [
+        'spot_price_realized__eur_per_mwh', 
+        'spot_price_forecast__eur_per_mwh__areaB',
+        'spot_price_forecast__eur_per_mwh__areaC', 
+        'imbalance_price__eur_per_mwh',
+        'spread_BM_S_area_A', 
+        'spread_BM_S_area_B', 
+        'spread_BM_S_area_C',
+        'consumption_forecast__mwh', 
+        'total_forecasted_gen__areaA'
+    ]
+    SMA_EMA_window_sizes = {
+        "SMA_1d": 24,
+        "SMA_7d": 24 * 7,
+        "EMA_1d": 24,
+        "EMA_7d": 24 * 7
+    }
+    lag_columns = [
+        'spot_price_realized__eur_per_mwh', 
+        'spot_price_forecast__eur_per_mwh__areaB',
+        'spot_price_forecast__eur_per_mwh__areaC', 
+        'imbalance_price__eur_per_mwh',
+        'spread_BM_S_area_A', 
+        'spread_BM_S_area_B', 
+        'spread_BM_S_area_C',
+        'consumption_forecast__mwh', 
+        'total_forecasted_gen__areaA'
+    ]
+    lag_periods = [24, 24*2, 24*7]
+
+    def __init__(self, args, imputed_df, incremental=False, stage_cache=None, input_key=None):
+        self._imputed_data = imputed_df.lazy()
         self._preprocessed_data = None
-        self._preprocess()
+        self.state_dir = os.path.join(args.current_dir, 'data', 'feature_state')
+        self._tail = None
+        self._ewm_state = None
+        self.cache_key = None
+        if incremental and self._load_state():
+            self._preprocess_incremental()
+        elif stage_cache is not None and not incremental:
+            self._preprocess_cached(stage_cache, input_key)
+        else:
+            self._preprocess()
+        if incremental:
+            self._save_state()
 
-    def _engineer_features(self):
-        return self._imputed_data.with_columns([
+    def _engineer_features(self, df):
+        return df.with_columns([
             # Time features
             pl.when(pl.col('datetime').dt.month().is_in([12, 1, 2])).then(0)
               .when(pl.col('datetime').dt.month().is_in([3, 4, 5])).then(1)
@@ -44,63 +88,168 @@ class FeatureEngineer:
             (pl.col('spot_commercial_flow_forecast__mw__to_areaB') + pl.col('spot_commercial_flow_forecast__mw__to_areaC')).alias('net_commercial_flow_areaA'),
         ])
 
-    def _add_moving_averages(self, df, columns, window_sizes):
+    def _moving_average_exprs(self, columns, window_sizes):
+        exprs = []
         for col in columns:
             for label, window in window_sizes.items():
                 if "SMA" in label:
-                    df = df.with_columns(
-                        pl.col(col).rolling_mean(window_size=window).alias(f"{col}_{label}")
-                    )
+                    exprs.append(pl.col(col).rolling_mean(window_size=window).alias(f"{col}_{label}"))
                 elif "EMA" in label:
-                    df = df.with_columns(
-                        pl.col(col).ewm_mean(span=window).alias(f"{col}_{label}")
-                    )
-        return df
+                    exprs.append(pl.col(col).ewm_mean(span=window).alias(f"{col}_{label}"))
+        return exprs
 
-    def _add_lagged_values(self, df, columns, lag_periods):
-        for col in columns:
-            for lag in lag_periods:
-                df = df.with_columns(
-                    pl.col(col).shift(lag).alias(f"{col}_lag_{lag}")
-                )
-        return df
+    def _lag_exprs(self, columns, lag_periods):
+        return [pl.col(col).shift(lag).alias(f"{col}_lag_{lag}") for col in columns for lag in lag_periods]
+
+    @cached_property
+    def _window_exprs(self):
+        # Built once and reused by every update()
+        return (self._moving_average_exprs(self.SMA_EMA_columns, self.SMA_EMA_window_sizes) +
+                self._lag_exprs(self.lag_columns, self.lag_periods))
+
+    def _add_window_features(self, df):
+        # One batched with_columns instead of one intermediate frame per (column, window) pair
+        return df.with_columns(self._window_exprs)
 
     def _preprocess(self):
-        df = self._engineer_features()
-
-        SMA_EMA_columns = [
-            'spot_price_realized__eur_per_mwh', 
-            'spot_price_forecast__eur_per_mwh__areaB',
-            'spot_price_forecast__eur_per_mwh__areaC', 
-            'imbalance_price__eur_per_mwh',
-            'spread_BM_S_area_A', 
-            'spread_BM_S_area_B', 
-            'spread_BM_S_area_C',
-            'consumption_forecast__mwh', 
-            'total_forecasted_gen__areaA'
-        ]
-        SMA_EMA_window_sizes = {
-            "SMA_1d": 24,
-            "SMA_7d": 24 * 7,
-            "EMA_1d": 24,
-            "EMA_7d": 24 * 7
+        df = self._engineer_features(self._imputed_data)
+        features = self._add_window_features(df).collect(engine='in-memory')
+        self._preprocessed_data = features.drop_nulls()
+        self._set_rolling_state(features.select(df.collect_schema().names()).tail(self._history_length()),
+                                features.tail(1), len(features))
+
+    def _set_rolling_state(self, tail, last_row, n_rows):
+        # Rolling state for incremental updates: the longest window of base rows and the EWM sums
+        self._tail = tail
+        self._ewm_state = {}
+        for col in self.SMA_EMA_columns:
+            for label, span in self.SMA_EMA_window_sizes.items():
+                if "EMA" in label:
+                    beta = 1 - 2 / (span + 1)
+                    den = (1 - beta ** n_rows) / (1 - beta)
+                    self._ewm_state[f"{col}_{label}"] = [last_row[f"{col}_{label}"][0] * den, den]
+
+    def cache_config(self):
+        return {
+            'SMA_EMA_columns': self.SMA_EMA_columns,
+            'SMA_EMA_window_sizes': self.SMA_EMA_window_sizes,
+            'lag_columns': self.lag_columns,
+            'lag_periods': self.lag_periods
         }
-        lag_columns = [
-            'spot_price_realized__eur_per_mwh', 
-            'spot_price_forecast__eur_per_mwh__areaB',
-            'spot_price_forecast__eur_per_mwh__areaC', 
-            'imbalance_price__eur_per_mwh',
-            'spread_BM_S_area_A', 
-            'spread_BM_S_area_B', 
-            'spread_BM_S_area_C',
-            'consumption_forecast__mwh', 
-            'total_forecasted_gen__areaA'
-        ]
-        lag_periods = [24, 24*2, 24*7]
-
-        df = self._add_moving_averages(df, SMA_EMA_columns, SMA_EMA_window_sizes)
-        df = self._add_lagged_values(df, lag_columns, lag_periods)
-        self._preprocessed_data = df.drop_nulls()
+
+    def _preprocess_cached(self, stage_cache, input_key):
+        self.cache_key = stage_cache.key('features', input_key, self.cache_config())
+        features = stage_cache.load('features', self.cache_key)
+        imputed_tail = self._imputed_data.tail(self._history_length()).collect()
+        n_rows = self._imputed_data.select(pl.len()).collect().item()
+        # The rolling state follows from the cached table: base features are row-local and the EWM sums
+        # only need the last row and the row count
+        if features is not None and len(features) and features['datetime'][-1] == imputed_tail['datetime'][-1]:
+            self._preprocessed_data = features
+            self._set_rolling_state(self._engineer_features(imputed_tail), features.tail(1), n_rows)
+            print("Features loaded from the stage cache")
+            return
+        self._preprocess()
+        stage_cache.save('features', self.cache_key, self._preprocessed_data)
+
+    def _history_length(self):
+        return max(max(self.SMA_EMA_window_sizes.values()), max(self.lag_periods))
+
+    def update(self, new_imputed_data, drop_nulls=True, advance=True):
+        """
+        Compute features for newly appended hours only, from the rolling state of the previous run.
+        With advance=False the rolling state is left unchanged, so the same hours can be scored again.
+        """
+        new = self._engineer_features(new_imputed_data)
+        combined = self._add_window_features(pl.concat([self._tail, new], how='vertical_relaxed'))
+        features = combined.tail(len(new))
+        k = np.arange(1, len(new) + 1)
+        # EWM of the new hours alone, all columns in one select
+        segments = new.select([
+            pl.col(col).ewm_mean(span=span).alias(f"{col}_{label}")
+            for col in self.SMA_EMA_columns for label, span in self.SMA_EMA_window_sizes.items() if "EMA" in label
+        ])
+        ema = []
+        ewm_state = {}
+        for col in self.SMA_EMA_columns:
+            for label, span in self.SMA_EMA_window_sizes.items():
+                if "EMA" in label:
+                    # Adjusted EWM continued from the stored weighted sum (num) and weight total (den)
+                    name = f"{col}_{label}"
+                    num, den = self._ewm_state[name]
+                    beta = 1 - 2 / (span + 1)
+                    weights = (1 - beta ** k) / (1 - beta)
+                    segment = segments[name].to_numpy() * weights
+                    new_den = weights + beta ** k * den
+                    values = (segment + beta ** k * num) / new_den
+                    ewm_state[name] = [values[-1] * new_den[-1], new_den[-1]]
+                    ema.append(pl.Series(name, values))
+        if advance:
+            self._ewm_state.update(ewm_state)
+            self._tail = pl.concat([self._tail, new], how='vertical_relaxed').tail(self._history_length())
+        features = features.with_columns(ema)
+        return features.drop_nulls() if drop_nulls else features
+
+    def _preprocess_incremental(self):
+        # The rolling state can run past the last stored feature row, whose nulls were dropped
+        new_imputed = self._imputed_data.filter(pl.col('datetime') > self.state_end).collect()
+        if len(new_imputed):
+            new_features = self.update(new_imputed)
+            self._preprocessed_data = pl.concat([self._preprocessed_data, new_features], how='vertical_relaxed')
+        print(f"Incremental features: {len(new_imputed)} new hours")
+
+    def _load_state(self):
+        if not os.path.exists(os.path.join(self.state_dir, 'features.parquet')) or not self.load_rolling_state(self.state_dir):
+            return False
+        self._preprocessed_data = pl.read_parquet(os.path.join(self.state_dir, 'features.parquet'))
+        return True
+
+    def _save_state(self):
+        self.save_rolling_state(self.state_dir)
+        self._preprocessed_data.write_parquet(os.path.join(self.state_dir, 'features.parquet'))
+
+    def load_rolling_state(self, state_dir):
+        paths = [os.path.join(state_dir, name) for name in ('tail.parquet', 'ewm.json')]
+        if not all(os.path.exists(path) for path in paths):
+            return False
+        self._tail = pl.read_parquet(paths[0])
+        with open(paths[1]) as f:
+            self._ewm_state = json.load(f)
+        return True
+
+    def save_rolling_state(self, state_dir):
+        """
+        Write the state update() continues from: the last base rows and the EWM sums.
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self._tail.write_parquet(os.path.join(state_dir, 'tail.parquet'))
+        with open(os.path.join(state_dir, 'ewm.json'), 'w') as f:
+            json.dump(self._ewm_state, f)
+
+    @classmethod
+    def from_rolling_state(cls, state_dir):
+        """
+        Engineer restored from a saved rolling state, used only to compute features of new hours with update().
+        """
+        engineer = cls.__new__(cls)
+        engineer._imputed_data = None
+        engineer._preprocessed_data = None
+        engineer.state_dir = state_dir
+        if not engineer.load_rolling_state(state_dir):
+            raise FileNotFoundError(f"No rolling feature state in {state_dir}")
+        return engineer
+
+    @property
+    def state_end(self):
+        return self._tail['datetime'][-1]
+
+    @property
+    def state_schema(self):
+        return self._tail.schema
+
+    @property
+    def input_columns(self):
+        return self._imputed_data.collect_schema().names()
 
     @property
     def preprocessed_data(self):
@@ -0,0 +1,115 @@
+# FeatureSelector
+
+# Import libraries
+import json
+import time
+from datetime import datetime
+import numpy as np
+import polars as pl
+import xgboost as xgb
+
+# Import custom library
+from src.DataPlotter import DataPlotter
+
+class FeatureSelector:
+    """
+    Prunes engineered columns before model training: a correlation pass keeps the more important
+    column of every highly collinear pair, then columns with a negligible share of a proxy model's
+    gain are dropped. Selection only looks at rows before selection_end, so validation and test
+    periods do not leak into the choice.
+    """
+    required_columns = ['datetime', 'imbalance_price__eur_per_mwh']
+    proxy_params = {
+        'objective': 'reg:squarederror',
+        'tree_method': 'hist',
+        'max_depth': 6,
+        'learning_rate': 0.1,
+        'subsample': 0.8,
+        'colsample_bytree': 0.8,
+        'random_state': 42
+    }
+    proxy_rounds = 100
+
+    def __init__(self, args, data):
+        self.output_filepath = args.output_filepath
+        self.corr_threshold = getattr(args, 'corr_threshold', 0.95)
+        self.min_importance = getattr(args, 'min_importance', 0.0001)
+        self.selection_end = getattr(args, 'selection_end', '2023-07-01')
+        self.candidates = [col for col in data.columns if col not in self.required_columns]
+        self._data = data.filter(pl.col('datetime') < datetime.fromisoformat(self.selection_end))
+        if len(self._data) == 0:
+            raise ValueError(f"No rows before selection_end {self.selection_end} to select features on.")
+        self.report = self._select()
+        self.save()
+
+    def proxy_importance(self, X, y):
+        """
+        Share of the total split gain of a small XGBoost model per column of X.
+        """
+        booster = xgb.train(self.proxy_params, xgb.QuantileDMatrix(X, y), num_boost_round=self.proxy_rounds)
+        gain = booster.get_score(importance_type='total_gain')
+        importance = np.array([gain.get(f"f{i}", 0.0) for i in range(X.shape[1])])
+        return importance / importance.sum()
+
+    def _select(self):
+        start = time.perf_counter()
+        X = self._data.select(pl.col(self.candidates).cast(pl.Float32)).to_numpy(order='c')
+        y = self._data['imbalance_price__eur_per_mwh'].to_numpy()
+        importance = self.proxy_importance(X, y)
+        corr, _ = DataPlotter.correlation_matrix(self._data.select(['datetime'] + self.candidates))
+        abs_corr = np.nan_to_num(np.abs(corr), nan=0.0)
+        # Walk columns from most to least important; a column correlated above the threshold with a kept one is redundant
+        kept, dropped = [], {}
+        for i in np.argsort(-importance, kind='stable'):
+            partner = max(kept, key=lambda k: abs_corr[i, k], default=None)
+            if partner is not None and abs_corr[i, partner] > self.corr_threshold:
+                dropped[self.candidates[i]] = f"corr {abs_corr[i, partner]:.3f} with {self.candidates[partner]}"
+            elif importance[i] < self.min_importance:
+                dropped[self.candidates[i]] = f"importance {importance[i]:.5f}"
+            else:
+                kept.append(i)
+        selection_seconds = time.perf_counter() - start
+        kept = sorted(kept)
+        return {
+            'selected_features': [self.candidates[i] for i in kept],
+            'dropped_features': dropped,
+            'corr_threshold': self.corr_threshold,
+            'min_importance': self.min_importance,
+            'selection_end': self.selection_end,
+            'n_candidates': len(self.candidates),
+            'n_selected': len(kept),
+            'selection_seconds': selection_seconds,
+            **self.measure_savings(X, y, kept)
+        }
+
+    def measure_savings(self, X, y, kept, n_rounds=200, repeats=3):
+        """
+        Training and prediction time of a model with the default depth on all candidate columns versus the selected ones.
+        """
+        params = dict(self.proxy_params, max_depth=5, learning_rate=0.076)
+        timings = {}
+        for name, matrix in (('all', X), ('selected', np.ascontiguousarray(X[:, kept]))):
+            start = time.perf_counter()
+            booster = xgb.train(params, xgb.QuantileDMatrix(matrix, y), num_boost_round=n_rounds)
+            timings[f"train_seconds_{name}"] = time.perf_counter() - start
+            predict = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                booster.inplace_predict(matrix)
+                predict.append(time.perf_counter() - start)
+            timings[f"predict_seconds_{name}"] = min(predict)
+        timings['train_time_saved'] = 1 - timings['train_seconds_selected'] / timings['train_seconds_all']
+        timings['predict_time_saved'] = 1 - timings['predict_seconds_selected'] / timings['predict_seconds_all']
+        return timings
+
+    def save(self):
+        with open(self.output_filepath + '/selected_features.json', 'w') as f:
+            json.dump(self.report, f, indent=2)
+        report = self.report
+        print(f"Feature selection: kept {report['n_selected']} of {report['n_candidates']} columns in {report['selection_seconds']:.1f}s")
+        print(f"Train time {report['train_seconds_all']:.2f}s -> {report['train_seconds_selected']:.2f}s ({-report['train_time_saved']:+.0%}), "
+              f"predict time {report['predict_seconds_all'] * 1000:.1f}ms -> {report['predict_seconds_selected'] * 1000:.1f}ms ({-report['predict_time_saved']:+.0%})")
+
+    @property
+    def selected_features(self):
+        return self.report['selected_features']
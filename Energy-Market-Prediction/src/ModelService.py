@@ -0,0 +1,124 @@
+# ModelService
+
+# Import libraries
+import os
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import polars as pl
+from xgboost import XGBRegressor
+
+# Import custom library
+from src.FeatureEngineer import FeatureEngineer
+
+ARTIFACT_FORMAT_VERSION = 1
+
+class ModelService:
+    """
+    Loads a saved model artifact once and scores new hours from its persisted rolling feature state,
+    without the full frames of the batch pipeline.
+    """
+    def __init__(self, artifact_dir):
+        # A models directory resolves to the version its 'latest' file points at
+        if os.path.exists(os.path.join(artifact_dir, 'latest')):
+            with open(os.path.join(artifact_dir, 'latest')) as f:
+                artifact_dir = os.path.join(artifact_dir, f.read().strip())
+        with open(os.path.join(artifact_dir, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact format {self.manifest['format_version']} in {artifact_dir}")
+        self.artifact_dir = artifact_dir
+        self.version = self.manifest['version']
+        self.feature_cols = self.manifest['feature_cols']
+        self.input_columns = self.manifest['input_columns']
+        self.model = XGBRegressor()
+        self.model.load_model(os.path.join(artifact_dir, 'model.ubj'))
+        self._booster = self.model.get_booster()
+        self.engineer = FeatureEngineer.from_rolling_state(os.path.join(artifact_dir, 'feature_state'))
+        self._input_schema = {col: self.engineer.state_schema[col] for col in self.input_columns}
+        # update() advances the rolling state, so requests are scored one at a time
+        self._lock = threading.Lock()
+
+    def _validate(self, rows):
+        missing = [col for col in self.input_columns if col not in rows.columns]
+        if missing:
+            raise ValueError(f"Missing input columns: {', '.join(missing)}")
+        rows = rows.select(self.input_columns)
+        if rows.schema['datetime'] == pl.String:
+            rows = rows.with_columns(pl.col('datetime').str.to_datetime())
+        rows = rows.cast(self._input_schema).sort('datetime')
+        expected = self.engineer.state_end + timedelta(hours=1)
+        if len(rows) == 0 or rows['datetime'][0] != expected:
+            raise ValueError(f"Hours must start at {expected}, the hour after the rolling state")
+        if (rows['datetime'].diff().drop_nulls() != timedelta(hours=1)).any():
+            raise ValueError("Hours must be consecutive")
+        return rows
+
+    def predict(self, rows, advance=True):
+        """
+        Predicted imbalance price for consecutive imputed hours following the rolling state.
+        With advance the hours become part of the state, so the next call continues after them.
+        """
+        with self._lock:
+            features = self.engineer.update(self._validate(rows), drop_nulls=False, advance=advance)
+        X = features.select(pl.col(self.feature_cols).cast(pl.Float32)).to_numpy(order='c')
+        return features.select('datetime').with_columns(
+            pl.Series('predicted_balancing_price', self._booster.inplace_predict(X))
+        )
+
+    def predict_records(self, records, advance=True):
+        predictions = self.predict(pl.DataFrame(records), advance=advance)
+        return {
+            'version': self.version,
+            'predictions': [
+                {'datetime': row['datetime'].isoformat(), 'predicted_balancing_price': float(row['predicted_balancing_price'])}
+                for row in predictions.iter_rows(named=True)
+            ]
+        }
+
+    def health(self):
+        return {'version': self.version, 'state_end': self.engineer.state_end.isoformat()}
+
+class _PredictHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client reuses one connection for many requests; without TCP_NODELAY the separate
+    # header and body writes wait on delayed ACKs (~40 ms per response)
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        self._send_json(200, self.server.service.health())
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            response = self.server.service.predict_records(payload['rows'], advance=payload.get('advance', True))
+        except (ValueError, KeyError, TypeError, pl.exceptions.PolarsError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, response)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(service, host='127.0.0.1', port=8000):
+    """
+    HTTP server exposing POST /predict ({"rows": [...], "advance": true}) and GET /health.
+    """
+    server = ThreadingHTTPServer((host, port), _PredictHandler)
+    server.service = service
+    return server
@@ -2,74 +2,138 @@
 import polars as pl
 import numpy as np
 from sklearn.metrics import mean_squared_error
+import xgboost as xgb
 from xgboost import XGBRegressor
 import optuna
 import pandas as pd
 import logging
+import os
+import json
 import matplotlib.pyplot as plt
+import multiprocessing
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from optuna.trial import TrialState
+from optuna.storages.journal import JournalFileBackend
 
 from src.DataPlotter import DataPlotter
+from src.DataProcessor import DataProcessor
+from src.ModelService import ARTIFACT_FORMAT_VERSION
 
 class Predictor:
-    def __init__(self, args, full_dataset):
+    # Used when no persisted study provides tuned hyperparameters (n_estimators, learning_rate, max_depth from the best trial in the README)
+    DEFAULT_PARAMS = {
+        'n_estimators': 498,
+        'learning_rate': 0.076,
+        'max_depth': 5,
+        'subsample': 0.8,
+        'colsample_bytree': 0.8,
+        'gamma': 0.0,
+        'reg_alpha': 0.0,
+        'reg_lambda': 1.0,
+        'sensitivity': 0.1
+    }
+
+    def __init__(self, args, full_dataset, selected_features=None):
         self.args = args
         self.full_dataset = full_dataset
+        # Model inputs chosen by FeatureSelector; None uses every engineered column
+        self.selected_features = selected_features
         self.output_filepath = self.args.output_filepath
+        self.n_threads = -1
+        self.study_workers = getattr(args, 'study_workers', 1)
+        self.study_storage = getattr(args, 'study_storage', None)
+        self.study_name = getattr(args, 'study_name', 'imbalance_price')
+        self.prune = getattr(args, 'prune', False)
+        if self.study_workers > 1 and not self.study_storage:
+            self.study_storage = self.output_filepath + '/optuna_study.log'
+        # id(split) -> design matrices of the split; the split itself is kept so its id is not reused
+        self._design_cache = {}
         optuna.logging.set_verbosity(optuna.logging.WARNING)
 
-    def train_predict_model_with_params(self, train_data, val_data, params):
+    def _design(self, data):
+        if id(data) not in self._design_cache:
+            required_columns = ['datetime', 'imbalance_price__eur_per_mwh']
+            for col in required_columns:
+                if col not in data.columns:
+                    raise ValueError(f"Column '{col}' not found in data.")
+            # Use all columns except 'datetime' and 'imbalance_price__eur_per_mwh' as features
+            feature_cols = [col for col in data.columns if col not in required_columns]
+            if self.selected_features is not None:
+                feature_cols = [col for col in feature_cols if col in self.selected_features]
+            self._design_cache[id(data)] = {
+                'data': data,
+                'X': data.select(pl.col(feature_cols).cast(pl.Float32)).to_numpy(order='c'),
+                'y': data['imbalance_price__eur_per_mwh'].to_numpy(),
+                'feature_cols': feature_cols,
+                'dtrain': None
+            }
+        return self._design_cache[id(data)]
+
+    def design_matrix(self, data):
+        """
+        Contiguous float32 feature matrix and target of a data split, built once and reused by every trial.
+        """
+        design = self._design(data)
+        return design['X'], design['y'], design['feature_cols']
+
+    def training_matrix(self, data):
+        """
+        Quantized XGBoost training matrix of a data split, built once and reused by every trial.
+        """
+        design = self._design(data)
+        if design['dtrain'] is None:
+            design['dtrain'] = xgb.QuantileDMatrix(design['X'], design['y'])
+        return design['dtrain']
+
+    def xgb_params(self, params):
+        return {
+            'objective': 'reg:squarederror',
+            'learning_rate': params['learning_rate'],
+            'max_depth': int(params['max_depth']),
+            'subsample': params['subsample'],
+            'colsample_bytree': params['colsample_bytree'],
+            'gamma': params['gamma'],
+            'reg_alpha': params['reg_alpha'],
+            'reg_lambda': params['reg_lambda'],
+            'random_state': 42,
+            'n_jobs': self.n_threads
+        }
+
+    def train_predict_model_with_params(self, train_data, val_data, params, callbacks=None):
         """
         Train an XGBoost model with given hyperparameters to predict 'imbalance_price__eur_per_mwh' and make predictions on validation data.
         """
-        train_df = train_data.to_pandas()
-        val_df = val_data.to_pandas()
-        required_columns = ['datetime', 'imbalance_price__eur_per_mwh']
-        for col in required_columns:
-            if col not in train_df.columns or col not in val_df.columns:
-                raise ValueError(f"Column '{col}' not found in data.")
-        # Use all columns except 'datetime' and 'imbalance_price__eur_per_mwh' as features
-        feature_cols = [col for col in train_df.columns if col not in ['datetime', 'imbalance_price__eur_per_mwh']]
-        target_col = 'imbalance_price__eur_per_mwh'
-        X_train = train_df[feature_cols]
-        y_train = train_df[target_col]
-        X_val = val_df[feature_cols]
-        y_val = val_df[target_col]
-        if X_train.empty or X_val.empty:
+        X_train, y_train, feature_cols = self.design_matrix(train_data)
+        X_val, y_val, _ = self.design_matrix(val_data)
+        if X_train.size == 0 or X_val.size == 0:
             raise ValueError("Training or validation data is empty after filtering.")
-        model = XGBRegressor(
-            objective='reg:squarederror',
-            n_estimators=int(params['n_estimators']),
-            learning_rate=params['learning_rate'],
-            max_depth=int(params['max_depth']),
-            subsample=params['subsample'],
-            colsample_bytree=params['colsample_bytree'],
-            gamma=params['gamma'],
-            reg_alpha=params['reg_alpha'],
-            reg_lambda=params['reg_lambda'],
-            random_state=42,
-            n_jobs=-1
-        )
-        model.fit(X_train, y_train)
-        val_predictions = model.predict(X_val)
+        # Per trial only the boosting runs: the quantized training matrix is shared by all trials
+        booster = xgb.train(self.xgb_params(params), self.training_matrix(train_data),
+                            num_boost_round=int(params['n_estimators']), callbacks=callbacks)
+        model = XGBRegressor(n_estimators=int(params['n_estimators']), **self.xgb_params(params))
+        model.load_model(booster.save_raw())
+        val_predictions = booster.inplace_predict(X_val)
         val_data = val_data.with_columns([
             pl.Series("predicted_balancing_price", val_predictions)
         ])
         return val_data, model, feature_cols
 
+    @staticmethod
+    def trading_quantity_expr(price_spread, trading_quantity, sensitivity):
+        return (pl.when(price_spread >= 0)
+                  .then(trading_quantity * (1 - (-sensitivity * price_spread).exp()))
+                  .otherwise(-trading_quantity * (1 - (sensitivity * price_spread).exp())))
+
     def backtest_strategy(self, data, trading_quantity, params):
         sensitivity = params['sensitivity']
         data = data.with_columns([
             (pl.col("predicted_balancing_price") - pl.col("spot_price_forecast__eur_per_mwh")).alias("price_spread")
         ])
-        def calculate_trading_quantity(x):
-            if x >= 0:
-                return trading_quantity * (1 - np.exp(-sensitivity * x))
-            else:
-                return -trading_quantity * (1 - np.exp(sensitivity * x))
         data = data.with_columns([
-            pl.col("price_spread")
-              .map_elements(calculate_trading_quantity, return_dtype=pl.Float64)
-              .alias("trading_quantity")
+            self.trading_quantity_expr(pl.col("price_spread"), trading_quantity, sensitivity).alias("trading_quantity")
         ])
         data = data.with_columns([
             (pl.col("trading_quantity") * 
@@ -79,16 +143,27 @@ class Predictor:
         total_pnl = data["PNL"].sum()
         return data, total_pnl
 
+    def backtest_sensitivities(self, data, trading_quantity, sensitivities, chunk_size=64):
+        """
+        Total PNL of the exponential sizing rule for every sensitivity in one pass over the series.
+        """
+        price_spread = (data["predicted_balancing_price"] - data["spot_price_forecast__eur_per_mwh"]).to_numpy()
+        price_diff = (data["imbalance_price__eur_per_mwh"] - data["spot_price_realized__eur_per_mwh"]).to_numpy()
+        sensitivities = np.asarray(sensitivities, dtype=np.float64)
+        # Quantity is sign(spread) * q * (1 - exp(-s * |spread|)), so PNL per sensitivity is a matrix-vector product
+        signed_diff = np.sign(price_spread) * price_diff * trading_quantity
+        abs_spread = np.abs(price_spread)
+        pnl = np.empty(len(sensitivities))
+        for start in range(0, len(sensitivities), chunk_size):
+            s = sensitivities[start:start + chunk_size, None]
+            pnl[start:start + chunk_size] = -np.expm1(-s * abs_spread) @ signed_diff
+        return pnl
+
     def evaluate_model_performance(self, model, test_data):
         """
         Evaluate the model's performance on test data.
         """
-        test_df = test_data.to_pandas()
-        # Use all columns except 'datetime' and 'imbalance_price__eur_per_mwh' as features
-        feature_cols = [col for col in test_df.columns if col not in ['datetime', 'imbalance_price__eur_per_mwh']]
-        target_col = 'imbalance_price__eur_per_mwh'
-        X_test = test_df[feature_cols]
-        y_test = test_df[target_col]
+        X_test, y_test, _ = self.design_matrix(test_data)
         test_predictions = model.predict(X_test)
         mse = mean_squared_error(y_test, test_predictions)
         rmse = np.sqrt(mse)
@@ -101,6 +176,87 @@ class Predictor:
             'MAPE': mape
         }, test_predictions
     
+    def objective(self, trial, train_data, val_data, max_trade):
+        params = {
+            'n_estimators': trial.suggest_int('n_estimators', 50, 500),
+            'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
+            'max_depth': trial.suggest_int('max_depth', 3, 10),
+            'subsample': trial.suggest_float('subsample', 0.5, 1.0),
+            'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
+            'gamma': trial.suggest_float('gamma', 0, 5),
+            'reg_alpha': trial.suggest_float('reg_alpha', 0, 5),
+            'reg_lambda': trial.suggest_float('reg_lambda', 0, 5),
+            'sensitivity': trial.suggest_float('sensitivity', 0.01, 1.0),
+        }
+        callbacks = None
+        if self.prune:
+            X_val, _, _ = self.design_matrix(val_data)
+            callbacks = [PnLPruningCallback(trial, self, val_data, X_val, max_trade, params['sensitivity'])]
+        # Train the model and make predictions
+        try:
+            val_data_with_predictions, _, _ = self.train_predict_model_with_params(train_data, val_data, params, callbacks)
+        except ValueError as e:
+            trial.set_user_attr('status', 'Failed')
+            trial.set_user_attr('exception', str(e))
+            trial.set_user_attr('pnl', float('-inf'))
+            return float('inf') 
+        val_data_with_predictions = val_data_with_predictions.drop_nulls(subset=["predicted_balancing_price"])
+        if len(val_data_with_predictions) == 0:
+            trial.set_user_attr('status', 'No valid predictions')
+            trial.set_user_attr('pnl', float('-inf'))
+            return float('inf')
+        # Backtest strategy
+        _, total_pnl = self.backtest_strategy(val_data_with_predictions, max_trade, params)
+        trial.set_user_attr('status', 'Success')
+        trial.set_user_attr('pnl', total_pnl)
+        return -total_pnl
+
+    def create_study(self):
+        """
+        In-memory study, or a persistent one when a storage file is set (SQLite for .db/.sqlite, otherwise a journal file).
+        """
+        pruner = optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=50) if self.prune else optuna.pruners.NopPruner()
+        if not self.study_storage:
+            return optuna.create_study(direction='minimize', pruner=pruner)
+        return optuna.create_study(direction='minimize', pruner=pruner, study_name=self.study_name,
+                                   storage=open_storage(self.study_storage), load_if_exists=True)
+
+    def optimize_in_workers(self, train_data, val_data, max_trade, n_trials):
+        # Each worker runs a fixed share of the n_trials, so the budget is exact however the trials interleave
+        shares = [n_trials // self.study_workers + (i < n_trials % self.study_workers) for i in range(self.study_workers)]
+        shares = [share for share in shares if share]
+        # Cap XGBoost threads so the worker processes share the cores instead of oversubscribing them
+        n_threads = max(1, DataProcessor.available_cores() // len(shares))
+        print(f"Running trials in {len(shares)} worker processes with {n_threads} XGBoost threads each")
+        # spawn, not fork: a forked child can deadlock on the polars thread pool of the parent
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=_optimize_worker, args=(self, train_data, val_data, max_trade, share, n_threads))
+            for share in shares
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    @staticmethod
+    def study_results(study):
+        all_results = []
+        for trial in study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)):
+            result = {
+                'trial_number': trial.number,
+                'params': dict(trial.params),
+                'pnl': trial.user_attrs.get('pnl'),
+                'status': trial.user_attrs.get('status')
+            }
+            if trial.state == TrialState.PRUNED:
+                result['status'] = 'Pruned'
+                result['pnl'] = -trial.intermediate_values[trial.last_step] if trial.last_step is not None else None
+            if 'exception' in trial.user_attrs:
+                result['exception'] = trial.user_attrs['exception']
+            all_results.append(result)
+        return all_results
+
     def hyperparameter_optimization(self, data, train_start_date, val_start_date, test_start_date, test_end_date, max_trade, n_trials=40):
         # Split data into training, validation, and test sets
         train_data = data.filter(
@@ -117,54 +273,19 @@ class Predictor:
         )
         if len(train_data) == 0 or len(val_data) == 0 or len(test_data) == 0:
             raise ValueError("One of the data splits is empty. Please check your date ranges and data.")
-        all_results = []
-        def objective(trial):
-            params = {
-                'n_estimators': trial.suggest_int('n_estimators', 50, 500),
-                'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
-                'max_depth': trial.suggest_int('max_depth', 3, 10),
-                'subsample': trial.suggest_float('subsample', 0.5, 1.0),
-                'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
-                'gamma': trial.suggest_float('gamma', 0, 5),
-                'reg_alpha': trial.suggest_float('reg_alpha', 0, 5),
-                'reg_lambda': trial.suggest_float('reg_lambda', 0, 5),
-                'sensitivity': trial.suggest_float('sensitivity', 0.01, 1.0),
-            }
-            # Train the model and make predictions
-            try:
-                val_data_with_predictions, _, _ = self.train_predict_model_with_params(train_data, val_data, params)
-            except ValueError as e:
-                all_results.append({
-                    'trial_number': trial.number,
-                    'params': params,
-                    'pnl': float('-inf'),
-                    'status': 'Failed',
-                    'exception': str(e)
-                })
-                return float('inf') 
-            val_data_with_predictions = val_data_with_predictions.drop_nulls(subset=["predicted_balancing_price"])
-            if len(val_data_with_predictions) == 0:
-                all_results.append({
-                    'trial_number': trial.number,
-                    'params': params,
-                    'pnl': float('-inf'),
-                    'status': 'No valid predictions'
-                })
-                return float('inf')
-            # Backtest strategy
-            _, total_pnl = self.backtest_strategy(val_data_with_predictions, max_trade, params)
-            iteration_result = {
-                'trial_number': trial.number,
-                'params': params.copy(),
-                'pnl': total_pnl,
-                'status': 'Success'
-            }
-            all_results.append(iteration_result)
-            return -total_pnl
-                
-        study = optuna.create_study(direction='minimize')
+        study = self.create_study()
+        # Trials already finished in a persisted study count towards n_trials, so an interrupted study resumes
+        finished = len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)))
+        remaining = max(n_trials - finished, 0)
+        if finished:
+            print(f"Resuming study '{self.study_name}': {finished} trials finished, {remaining} to go")
         # Optimize the optuna study
-        study.optimize(objective, n_trials=n_trials)
+        if self.study_workers > 1 and remaining:
+            self.optimize_in_workers(train_data, val_data, max_trade, remaining)
+        elif remaining:
+            study.optimize(partial(self.objective, train_data=train_data, val_data=val_data, max_trade=max_trade),
+                           n_trials=remaining)
+        all_results = self.study_results(study)
         # Get the best hyperparameters
         best_params = study.best_params
         best_pnl = -study.best_value 
@@ -189,6 +310,16 @@ class Predictor:
             "trading_quantity",
             "PNL"
         ])
+        # PNL of the final model's test predictions over a dense sensitivity grid, without retraining
+        sensitivity_grid = np.linspace(0.01, 1.0, 100)
+        sensitivity_sweep = pd.DataFrame({
+            'sensitivity': sensitivity_grid,
+            'pnl': self.backtest_sensitivities(final_val_data_with_predictions, max_trade, sensitivity_grid)
+        })
+        self.sensitivity_sweep = sensitivity_sweep
+        self.final_model = final_model
+        self.final_params = dict(best_params)
+        self.feature_cols = feature_cols
         return simplified_results, all_results, final_model, feature_cols
 
     def run_optimization(self, data, train_start_date, val_start_date, test_start_date, test_end_date, max_trade=10, n_trials=2):
@@ -211,6 +342,224 @@ class Predictor:
         return simplified_results, csv_string, feature_importance_df
 
 
+    def best_params(self):
+        if self.study_storage and os.path.exists(self.study_storage):
+            study = optuna.load_study(study_name=self.study_name, storage=open_storage(self.study_storage))
+            return study.best_params
+        return dict(self.DEFAULT_PARAMS)
+
+    def walk_forward_folds(self, data, start_date, end_date, train_days, step_days):
+        """
+        Row ranges (train_start, train_end, test_start, test_end) of each fold: train on the train_days before a test window of step_days.
+        """
+        datetimes = data['datetime'].to_numpy()
+        folds = []
+        test_start = datetime(*start_date)
+        while test_start < datetime(*end_date):
+            test_end = min(test_start + timedelta(days=step_days), datetime(*end_date))
+            bounds = np.searchsorted(datetimes, np.array([test_start - timedelta(days=train_days), test_start, test_end], dtype='datetime64[ns]'))
+            if bounds[1] > bounds[0] and bounds[2] > bounds[1]:
+                folds.append((int(bounds[0]), int(bounds[1]), int(bounds[1]), int(bounds[2])))
+            test_start = test_end
+        return folds
+
+    def walk_forward(self, data, params, start_date, end_date, train_days=180, step_days=1, update_rounds=20,
+                     warm_start=True, refit_every=30, n_workers=1, max_trade=10):
+        """
+        Walk-forward backtest: retrain every step_days and trade the following window.
+        With warm_start each fold continues the previous fold's booster with update_rounds new trees on the
+        shifted window, with a full refit every refit_every folds so the ensemble does not grow without bound.
+        Folds are split into n_workers contiguous chains that run in parallel processes, each chain starting
+        from a full fit.
+        """
+        data = data.sort('datetime')
+        folds = self.walk_forward_folds(data, start_date, end_date, train_days, step_days)
+        if not folds:
+            raise ValueError("No walk-forward folds in the given date range.")
+        n_workers = max(1, min(n_workers, len(folds)))
+        chains = [list(chain) for chain in np.array_split(np.arange(len(folds)), n_workers)]
+        n_threads = max(1, DataProcessor.available_cores() // n_workers)
+        jobs = [(data, [(i, folds[i]) for i in chain], params, max_trade, warm_start, update_rounds, refit_every, n_threads)
+                for chain in chains]
+        print(f"Walk-forward: {len(folds)} folds in {n_workers} chain(s), {n_threads} XGBoost threads each")
+        if n_workers == 1:
+            results = [_walk_forward_chain(self, *jobs[0])]
+        else:
+            with ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = list(executor.map(_walk_forward_chain, [self] * n_workers, *zip(*jobs)))
+        fold_results = pd.DataFrame([fold for chain in results for fold in chain]).sort_values('fold')
+        fold_results['cumulative_pnl'] = fold_results['pnl'].cumsum()
+        return fold_results
+
+    def run_walk_forward(self):
+        args = self.args
+        fold_results = self.walk_forward(
+            self.full_dataset,
+            self.best_params(),
+            start_date=tuple(int(x) for x in args.wf_start.split('-')),
+            end_date=tuple(int(x) for x in args.wf_end.split('-')),
+            train_days=args.wf_train_days,
+            step_days=args.wf_step_days,
+            update_rounds=args.wf_update_rounds,
+            warm_start=not args.no_warm_start,
+            refit_every=args.wf_refit_every,
+            n_workers=args.wf_workers
+        )
+        fold_results.to_csv(self.output_filepath + "/walk_forward_folds.csv", index=False)
+        warm = fold_results[fold_results['warm_start']]
+        cold = fold_results[~fold_results['warm_start']]
+        print(f"Walk-forward: {len(fold_results)} folds, total PNL {fold_results['pnl'].sum():,.2f}")
+        print(f"Retrain time per fold: full fit {cold['train_seconds'].mean():.3f}s ({len(cold)} folds)"
+              + (f", warm start {warm['train_seconds'].mean():.3f}s ({len(warm)} folds)" if len(warm) else ""))
+
+    def horizon_targets(self, data, horizon):
+        """
+        Imbalance and spot prices `horizon` hours after each row (null where that hour is not in the data).
+        """
+        future = data.select(
+            pl.col('datetime').dt.offset_by(f"-{horizon}h").alias('datetime'),
+            pl.col('datetime').alias('target_datetime'),
+            pl.col('imbalance_price__eur_per_mwh').alias('target'),
+            pl.col('spot_price_forecast__eur_per_mwh').alias('target_spot_forecast'),
+            pl.col('spot_price_realized__eur_per_mwh').alias('target_spot_realized')
+        )
+        return data.select('datetime').join(future, on='datetime', how='left', maintain_order='left')
+
+    def train_quantile_models(self, train_data, params, horizons, quantiles, n_workers=None):
+        """
+        One quantile regression model per (horizon, quantile), all trained on the same float32 design matrix.
+        Models are fitted concurrently in n_workers threads with the cores split between them.
+        """
+        X, _, _ = self.design_matrix(train_data)
+        jobs = []
+        for horizon in horizons:
+            y = self.horizon_targets(train_data, horizon)['target'].to_numpy()
+            rows = np.flatnonzero(~np.isnan(y))
+            if len(rows) == 0:
+                raise ValueError(f"No {horizon}h-ahead targets in the training data. Please check your date ranges and horizons.")
+            # On contiguous hourly data the rows with a target are a prefix, so the shared matrix is sliced without a copy
+            X_horizon = X[:len(rows)] if rows[-1] == len(rows) - 1 else X[rows]
+            # The quantized matrix of a horizon is shared by its quantile models
+            dtrain = xgb.QuantileDMatrix(X_horizon, y[rows])
+            jobs += [(horizon, quantile, dtrain) for quantile in quantiles]
+        n_workers = max(1, min(n_workers or DataProcessor.available_cores(), len(jobs)))
+        n_threads = max(1, DataProcessor.available_cores() // n_workers)
+        xgb_params = dict(self.xgb_params(params), objective='reg:quantileerror', n_jobs=n_threads)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(n_workers) as executor:
+            boosters = list(executor.map(partial(_train_quantile_model, xgb_params, int(params['n_estimators'])), jobs))
+        seconds = time.perf_counter() - start
+        self.quantile_training = {
+            'n_models': len(jobs),
+            'workers': n_workers,
+            'threads_per_model': n_threads,
+            'seconds': seconds,
+            'models_per_minute': len(jobs) / seconds * 60
+        }
+        return {(horizon, quantile): booster for (horizon, quantile, _), booster in zip(jobs, boosters)}
+
+    def predict_quantiles(self, models, data, horizons, quantiles):
+        X, _, _ = self.design_matrix(data)
+        frames = []
+        for horizon in horizons:
+            # Sorting the quantiles per row removes crossings between the independently trained models
+            predictions = np.sort(np.column_stack([models[(horizon, q)].inplace_predict(X) for q in quantiles]), axis=1)
+            frames.append(self.horizon_targets(data, horizon).with_columns(
+                [pl.lit(horizon).alias('horizon')] +
+                [pl.Series(f"p{round(q * 100)}", predictions[:, i]) for i, q in enumerate(quantiles)]
+            ).drop_nulls('target'))
+        return pl.concat(frames)
+
+    @staticmethod
+    def quantile_quantity_expr(trading_quantity, sensitivity):
+        """
+        Exponential sizing on the P50 spread, scaled down while the spread is smaller than half the P10-P90 width.
+        """
+        spread = pl.col('p50') - pl.col('target_spot_forecast')
+        confidence = (spread.abs() / ((pl.col('p90') - pl.col('p10')) / 2)).fill_nan(0).clip(0, 1)
+        return Predictor.trading_quantity_expr(spread, trading_quantity, sensitivity) * confidence
+
+    def backtest_quantiles(self, predictions, trading_quantity, params):
+        price_diff = pl.col('target') - pl.col('target_spot_realized')
+        spread = pl.col('p50') - pl.col('target_spot_forecast')
+        return predictions.with_columns(
+            self.quantile_quantity_expr(trading_quantity, params['sensitivity']).alias('trading_quantity'),
+            self.trading_quantity_expr(spread, trading_quantity, params['sensitivity']).alias('trading_quantity_p50_only')
+        ).with_columns(
+            (pl.col('trading_quantity') * price_diff).alias('PNL'),
+            (pl.col('trading_quantity_p50_only') * price_diff).alias('PNL_p50_only')
+        )
+
+    def quantile_report(self, results, quantiles):
+        pinball = [
+            ((pl.col('target') - pl.col(f"p{round(q * 100)}")) *
+             (q - (pl.col('target') < pl.col(f"p{round(q * 100)}")).cast(pl.Float64))).mean().alias(f"pinball_p{round(q * 100)}")
+            for q in quantiles
+        ]
+        return results.group_by('horizon').agg(
+            [pl.len().alias('hours'),
+             ((pl.col('target') >= pl.col('p10')) & (pl.col('target') <= pl.col('p90'))).mean().alias('coverage_p10_p90')] +
+            pinball +
+            [pl.col('PNL').sum().alias('pnl'), pl.col('PNL_p50_only').sum().alias('pnl_p50_only'),
+             (pl.col('PNL').sum() / pl.col('trading_quantity').abs().sum()).alias('pnl_per_mwh'),
+             (pl.col('PNL_p50_only').sum() / pl.col('trading_quantity_p50_only').abs().sum()).alias('pnl_per_mwh_p50_only')]
+        ).sort('horizon')
+
+    def run_quantile(self):
+        args = self.args
+        horizons = parse_horizons(args.horizons)
+        quantiles = (0.1, 0.5, 0.9)
+        params = self.best_params()
+        data = self.full_dataset.sort('datetime')
+        train_data = data.filter((pl.col('datetime') >= pl.datetime(2023, 1, 1)) & (pl.col('datetime') < pl.datetime(2024, 1, 1)))
+        test_data = data.filter((pl.col('datetime') >= pl.datetime(2024, 1, 1)) & (pl.col('datetime') <= pl.datetime(2024, 8, 30)))
+        if len(train_data) == 0 or len(test_data) == 0:
+            raise ValueError("Training or test data is empty. Please check your date ranges and data.")
+        models = self.train_quantile_models(train_data, params, horizons, quantiles, args.quantile_workers)
+        results = self.backtest_quantiles(self.predict_quantiles(models, test_data, horizons, quantiles), 10, params)
+        training = self.quantile_training
+        # Training throughput is a run-level figure, repeated on every horizon row
+        report = self.quantile_report(results, quantiles).with_columns(
+            pl.lit(training['models_per_minute']).alias('models_per_minute'),
+            pl.lit(training['seconds']).alias('training_seconds'),
+            pl.lit(training['workers']).alias('training_workers'),
+            pl.lit(training['threads_per_model']).alias('threads_per_model')
+        )
+        results.write_parquet(self.output_filepath + "/quantile_predictions.parquet")
+        report.write_csv(self.output_filepath + "/quantile_report.csv")
+        print(f"Trained {training['n_models']} quantile models in {training['seconds']:.1f}s "
+              f"({training['models_per_minute']:.1f} models/minute, {training['workers']} workers x {training['threads_per_model']} threads)")
+        print(f"P10-P90 coverage {report['coverage_p10_p90'].mean():.1%}, PNL {report['pnl'].sum():,.2f} with quantile sizing "
+              f"vs {report['pnl_p50_only'].sum():,.2f} on P50 alone (summed over horizons)")
+        print(f"PNL per traded MWh: {results['PNL'].sum() / results['trading_quantity'].abs().sum():.2f} with quantile sizing "
+              f"vs {results['PNL_p50_only'].sum() / results['trading_quantity_p50_only'].abs().sum():.2f} on P50 alone")
+
+    def save_model_artifact(self, engineer, models_dir=None):
+        """
+        Persist the final model, its feature column order and the rolling feature state as a new artifact version,
+        and point models/latest at it. Returns the artifact directory.
+        """
+        models_dir = models_dir or os.path.join(self.output_filepath, 'models')
+        version = datetime.now().strftime('%Y%m%dT%H%M%S')
+        artifact_dir = os.path.join(models_dir, version)
+        engineer.save_rolling_state(os.path.join(artifact_dir, 'feature_state'))
+        self.final_model.save_model(os.path.join(artifact_dir, 'model.ubj'))
+        manifest = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'version': version,
+            'xgboost_version': xgb.__version__,
+            'target': 'imbalance_price__eur_per_mwh',
+            'feature_cols': self.feature_cols,
+            'input_columns': engineer.input_columns,
+            'params': self.final_params,
+            'state_end': str(engineer.state_end)
+        }
+        with open(os.path.join(artifact_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        with open(os.path.join(models_dir, 'latest'), 'w') as f:
+            f.write(version)
+        return artifact_dir
+
     def run_predictor(self):
         simplified_results, csv_string, feature_importance_df = self.run_optimization(
             self.full_dataset,
@@ -225,10 +574,96 @@ class Predictor:
         simplified_results.write_parquet(self.output_filepath + "/simplified_results.parquet") 
         with open(self.output_filepath + "/optimization_results.txt", "w") as f:
             f.write(csv_string)
+        self.sensitivity_sweep.to_csv(self.output_filepath + "/sensitivity_sweep.csv", index=False)
         
         # Plotting
         self.plotter = DataPlotter(self.args)
         self.plotter.corr_plot(self.full_dataset)
         self.plotter.plot_combined_results(simplified_results, feature_importance_df)
+        self.plotter.wait()
+
+def parse_horizons(spec):
+    """
+    Horizons in hours from a spec like '1-24' or '1,6,12,24'.
+    """
+    horizons = []
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        horizons += range(int(first), int(last or first) + 1)
+    if not horizons or min(horizons) < 1:
+        raise ValueError(f"Horizons must be a non-empty set of at least 1 hour, got '{spec}'.")
+    return sorted(set(horizons))
+
+def _train_quantile_model(xgb_params, n_estimators, job):
+    horizon, quantile, dtrain = job
+    return xgb.train(dict(xgb_params, quantile_alpha=quantile), dtrain, num_boost_round=n_estimators)
+
+def open_storage(path):
+    if path.endswith(('.db', '.sqlite')):
+        return f"sqlite:///{path}"
+    return optuna.storages.JournalStorage(JournalFileBackend(path))
+
+def _optimize_worker(predictor, train_data, val_data, max_trade, n_trials, n_threads):
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    predictor.n_threads = n_threads
+    study = predictor.create_study()
+    study.optimize(partial(predictor.objective, train_data=train_data, val_data=val_data, max_trade=max_trade),
+                   n_trials=n_trials)
+
+def _walk_forward_chain(predictor, data, folds, params, max_trade, warm_start, update_rounds, refit_every, n_threads):
+    predictor.n_threads = n_threads
+    X, y, _ = predictor.design_matrix(data)
+    xgb_params = predictor.xgb_params(params)
+    booster = None
+    results = []
+    for position, (fold, (train_start, train_end, test_start, test_end)) in enumerate(folds):
+        start = time.perf_counter()
+        dtrain = xgb.QuantileDMatrix(X[train_start:train_end], y[train_start:train_end])
+        if warm_start and booster is not None and not (refit_every and position % refit_every == 0):
+            booster = xgb.train(xgb_params, dtrain, num_boost_round=update_rounds, xgb_model=booster)
+            warm = True
+        else:
+            booster = xgb.train(xgb_params, dtrain, num_boost_round=int(params['n_estimators']))
+            warm = False
+        train_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        predictions = booster.inplace_predict(X[test_start:test_end])
+        predict_seconds = time.perf_counter() - start
+        test_data = data[test_start:test_end].with_columns(pl.Series("predicted_balancing_price", predictions))
+        results.append({
+            'fold': fold,
+            'train_start': data['datetime'][train_start],
+            'test_start': data['datetime'][test_start],
+            'test_end': data['datetime'][test_end - 1],
+            'train_rows': train_end - train_start,
+            'warm_start': warm,
+            'n_trees': booster.num_boosted_rounds(),
+            'train_seconds': train_seconds,
+            'predict_seconds': predict_seconds,
+            'pnl': predictor.backtest_sensitivities(test_data, max_trade, [params['sensitivity']])[0]
+        })
+    return results
 
+class PnLPruningCallback(xgb.callback.TrainingCallback):
+    """
+    Reports the validation PNL every few boosting rounds so the pruner can stop unpromising trials early.
+    """
+    def __init__(self, trial, predictor, val_data, X_val, max_trade, sensitivity, report_every=25):
+        self.trial = trial
+        self.predictor = predictor
+        self.val_data = val_data
+        self.X_val = X_val
+        self.max_trade = max_trade
+        self.sensitivity = sensitivity
+        self.report_every = report_every
 
+    def after_iteration(self, model, epoch, evals_log):
+        step = epoch + 1
+        if step % self.report_every:
+            return False
+        val_data = self.val_data.with_columns(pl.Series("predicted_balancing_price", model.inplace_predict(self.X_val)))
+        pnl = self.predictor.backtest_sensitivities(val_data, self.max_trade, [self.sensitivity])[0]
+        self.trial.report(-pnl, step)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned()
+        return False
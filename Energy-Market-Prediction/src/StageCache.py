@@ -0,0 +1,57 @@
+# StageCache
+
+# Import libraries
+import os
+import json
+import hashlib
+import polars as pl
+try:
+    import pyarrow as pa
+except ImportError:  # Without pyarrow cached stages are read into memory instead of memory-mapped
+    pa = None
+
+class StageCache:
+    """
+    Outputs of pipeline stages as uncompressed Arrow IPC files, keyed by a hash of the stage inputs and config.
+    Cached frames are memory-mapped on reuse, so a re-run only pages in the columns it touches.
+    """
+    # Bump when a stage's code changes its output, so entries written by older code are not reused
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1 << 20):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self, stage, *parts):
+        """
+        Hash of the stage name, the cache version and any JSON-serializable inputs (upstream keys, config).
+        """
+        payload = json.dumps([self.CACHE_VERSION, stage, *parts], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}-{key[:24]}.arrow")
+
+    def load(self, stage, key):
+        path = self.path(stage, key)
+        if not os.path.exists(path):
+            return None
+        if pa is None:
+            return pl.read_ipc(path)
+        return pl.from_arrow(pa.ipc.open_file(pa.memory_map(path)).read_all())
+
+    def save(self, stage, key, df):
+        path = self.path(stage, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Uncompressed, so the file can be mapped as is
+        df.write_ipc(tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+        return path
@@ -3,14 +3,110 @@ Portfolio metrics calculation utilities.
 """
 
 import yfinance as yf
-from datetime import datetime, timedelta
+from datetime import datetime
 import polars as pl
 
 
+def _cash_state(ledger, fixed_fx_rate):
+    """
+    Running cash, contributed capital, dividends and FX rate at the end of each transaction date.
+
+    Args:
+        ledger (pl.DataFrame): Transactions up to the last reported date, in processing order
+        fixed_fx_rate (float): USD.JPY rate used until the first FX conversion
+
+    Returns:
+        pl.DataFrame: One row per transaction date with the running totals after that day
+    """
+    kind, amount, quantity = pl.col('type'), pl.col('amount'), pl.col('quantity')
+    jpy_deposit = (kind == 'Deposit') & (pl.col('currency') == 'JPY').fill_null(False)
+    # JPY is not contributed until it is converted
+    usd_deposit = (kind == 'Deposit') & ~jpy_deposit
+    fx = kind == 'FX'
+    trade = (kind == 'Trade') & (pl.col('symbol').fill_null('') != '')
+
+    return ledger.select(
+        'date',
+        pl.when(usd_deposit).then(amount).when(fx).then(quantity).otherwise(0.0).cum_sum().alias('contributed'),
+        pl.when(jpy_deposit | fx).then(amount).otherwise(0.0).cum_sum().alias('jpy_cash'),
+        pl.when(usd_deposit | kind.is_in(['Dividend', 'Tax', 'Fee'])).then(amount)
+        .when(fx).then(quantity)
+        .when(trade).then(amount - pl.col('commission'))
+        .otherwise(0.0).cum_sum().alias('usd_cash'),
+        pl.when(kind == 'Dividend').then(amount).otherwise(0.0).cum_sum().alias('dividends'),
+        pl.when(fx & (quantity != 0)).then(amount.abs() / quantity.abs())
+        .forward_fill().fill_null(fixed_fx_rate).alias('fx_rate')
+    ).group_by('date', maintain_order=True).last()
+
+
+def _trade_state(trades):
+    """
+    Shares, average cost basis and realized P&L after each trade.
+
+    Each sell is priced at the average cost left by the trades before it, so this is a single
+    pass over the trades rather than over every day.
+
+    Args:
+        trades (pl.DataFrame): Trades up to the last reported date, in processing order
+
+    Returns:
+        tuple: (trades with shares, cost and realized_pnl columns, symbols in the order they were first bought)
+    """
+    holdings, cost_basis, realized_pnl = {}, {}, 0.0
+    shares, costs, realized = [], [], []
+
+    for sym, qty, amount, commission in zip(*(trades[col].to_list() for col in ['symbol', 'quantity', 'amount', 'commission'])):
+        if qty > 0:  # Buy
+            cost_basis[sym] = cost_basis.get(sym, 0) + (abs(amount) + abs(commission))
+        elif sym in cost_basis and holdings.get(sym, 0) > 0:  # Sell
+            sold_cost = (cost_basis[sym] / holdings[sym]) * abs(qty)
+            realized_pnl += (amount - commission) - sold_cost
+            cost_basis[sym] -= sold_cost
+
+        holdings[sym] = holdings.get(sym, 0) + qty
+        shares.append(holdings[sym])
+        costs.append(cost_basis.get(sym, 0.0))
+        realized.append(realized_pnl)
+
+    state = trades.select('date', 'symbol').with_columns(
+        pl.Series('shares', shares, dtype=pl.Float64),
+        pl.Series('cost', costs, dtype=pl.Float64),
+        pl.Series('realized_pnl', realized, dtype=pl.Float64)
+    )
+    return state, list(cost_basis)
+
+
+def _symbol_as_of(calendar, state, value, suffix):
+    """
+    Last value of a per-symbol column on or before each calendar day, one {symbol}_{suffix} column per symbol.
+    """
+    wide = (
+        state.group_by(['date', 'symbol'], maintain_order=True).last()
+        .pivot(on='symbol', index='date', values=value)
+        .sort('date')
+        .fill_null(strategy='forward')
+    )
+    wide = wide.rename({col: f'{col}_{suffix}' for col in wide.columns if col != 'date'})
+    return calendar.join_asof(wide, on='date')
+
+
+def _running_sum(exprs):
+    """
+    Left-to-right sum of columns, in the given order; 0.0 when there are none.
+    """
+    if not exprs:
+        return pl.lit(0.0)
+    return pl.fold(pl.lit(0.0), lambda acc, x: acc + x, exprs)
+
+
 def calculate_portfolio_metrics(transactions):
     """
     Calculate portfolio metrics over time from transaction history.
 
+    Transactions are replayed once into running totals, which are then as-of joined onto the
+    daily calendar and the price matrix, so the cost grows with days × symbols only in
+    vectorized column operations.
+
     Args:
         transactions (pl.DataFrame): DataFrame of transactions from load_transactions()
 
@@ -31,13 +127,15 @@ def calculate_portfolio_metrics(transactions):
             - {symbol}_shares: Shares held for each symbol
             - {symbol}_value: Market value for each symbol
     """
+    today = datetime.now().date()
+    start = transactions['date'].min()
+
     # Get symbols and download prices
     all_symbols = transactions.filter(
         (pl.col('type') == 'Trade') & (pl.col('symbol').is_not_null())
-    )['symbol'].unique().to_list()
+    )['symbol'].unique(maintain_order=True).to_list()
 
-    price_data = yf.download(all_symbols, start=transactions['date'].min(),
-                             end=datetime.now().date(), progress=False, auto_adjust=True)
+    price_data = yf.download(all_symbols, start=start, end=today, progress=False, auto_adjust=True)
     if len(all_symbols) == 1:
         price_data = price_data[['Close']].rename(columns={'Close': all_symbols[0]})
     else:
@@ -47,91 +145,74 @@ def calculate_portfolio_metrics(transactions):
     first_fx = transactions.filter((pl.col('type') == 'FX') & (pl.col('symbol') == 'USD.JPY') & (pl.col('quantity') != 0))
     fixed_fx_rate = abs(first_fx[0, 'amount']) / abs(first_fx[0, 'quantity'])
 
-    # Initialize
-    contributed = jpy_cash = usd_cash = dividends = realized_pnl = 0.0
-    current_fx_rate = fixed_fx_rate
-    holdings = {}
-    current_holdings_cost = {}
-    daily_values = []
-
-    # Generate dates and process
-    current = transactions['date'].min()
-    while current <= datetime.now().date():
-        # Process day's transactions
-        for row in transactions.filter(pl.col('date') == current).iter_rows(named=True):
-            if row['type'] == 'Deposit':
-                if row['currency'] == 'JPY':
-                    jpy_cash += row['amount']
-                    # Don't add to contributed yet - wait for actual FX conversion
-                else:
-                    usd_cash += row['amount']
-                    contributed += row['amount']
-            elif row['type'] == 'FX':
-                # Add actual USD from FX conversions to contributed capital
-                contributed += row['quantity']
-                usd_cash += row['quantity']
-                jpy_cash += row['amount']
-                if row['quantity'] != 0:
-                    current_fx_rate = abs(row['amount']) / abs(row['quantity'])
-            elif row['type'] == 'Trade' and row['symbol']:
-                sym, qty = row['symbol'], row['quantity']
-                cost = abs(row['amount']) + abs(row['commission'])
-                usd_cash += row['amount'] - row['commission']
-
-                if qty > 0:  # Buy
-                    current_holdings_cost[sym] = current_holdings_cost.get(sym, 0) + cost
-                else:  # Sell
-                    if sym in current_holdings_cost and holdings.get(sym, 0) > 0:
-                        sold_cost = (current_holdings_cost[sym] / holdings[sym]) * abs(qty)
-                        realized_pnl += (row['amount'] - row['commission']) - sold_cost
-                        current_holdings_cost[sym] -= sold_cost
-
-                holdings[sym] = holdings.get(sym, 0) + qty
-                if holdings[sym] == 0:
-                    holdings.pop(sym, None)
-            elif row['type'] == 'Dividend':
-                usd_cash += row['amount']
-                dividends += row['amount']
-            elif row['type'] in ['Tax', 'Fee']:
-                usd_cash += row['amount']
-
-        # Calculate holdings value per symbol and store holdings + values
-        holdings_value = 0.0
-        day_data = {'date': current}
-
-        for sym in all_symbols:
-            shares = holdings.get(sym, 0)
-            sym_value = 0.0
-            if shares > 0 and sym in price_data.columns:
-                try:
-                    prices = price_data.loc[:str(current), sym]
-                    if len(prices) > 0:
-                        sym_value = shares * prices.iloc[-1]
-                        holdings_value += sym_value
-                except (KeyError, IndexError):
-                    pass
-            day_data[f'{sym}_shares'] = shares
-            day_data[f'{sym}_value'] = sym_value
-
-        total_cash = (jpy_cash / current_fx_rate) + usd_cash
-        invested_capital = sum(current_holdings_cost.values())
-        unrealized_pnl = holdings_value - invested_capital
-        equity = total_cash + holdings_value
-
-        # Contributed capital includes USD from FX + current value of unconverted JPY
-        total_contributed = contributed + (jpy_cash / current_fx_rate)
-
-        day_data.update({
-            'contributed': total_contributed, 'invested_capital': invested_capital,
-            'cash': total_cash, 'equity': equity, 'holdings_value': holdings_value,
-            'unrealized_pnl': unrealized_pnl, 'realized_pnl': realized_pnl,
-            'total_investment_pnl': unrealized_pnl + realized_pnl,
-            'portfolio_pnl': equity - total_contributed,
-            'return_pct': ((equity / total_contributed - 1) * 100) if total_contributed > 0 else 0,
-            'dividends': dividends
-        })
-
-        daily_values.append(day_data)
-        current += timedelta(days=1)
-
-    return pl.DataFrame(daily_values)
+    if start > today:
+        return pl.DataFrame()
+
+    # Same-day transactions keep their file order
+    ledger = transactions.sort('date', maintain_order=True).filter(pl.col('date') <= today)
+    trades = ledger.filter((pl.col('type') == 'Trade') & (pl.col('symbol').fill_null('') != ''))
+    trade_state, cost_order = _trade_state(trades)
+
+    calendar = pl.DataFrame({'date': pl.date_range(start, today, '1d', eager=True)})
+    daily = calendar.join_asof(_cash_state(ledger, fixed_fx_rate), on='date')
+    daily = daily.join_asof(
+        trade_state.group_by('date', maintain_order=True).agg(pl.col('realized_pnl').last()), on='date'
+    )
+    if len(trades) > 0:
+        daily = _symbol_as_of(daily, trade_state, 'shares', 'shares')
+        daily = _symbol_as_of(daily, trade_state, 'cost', 'cost')
+
+    # Last close on or before each day; NaN closes stay NaN, as yfinance reports them
+    priced = [sym for sym in all_symbols if sym in price_data.columns]
+    if priced:
+        prices = pl.DataFrame(
+            [pl.Series('date', price_data.index.values).cast(pl.Date)]
+            + [pl.Series(f'{sym}_price', price_data[sym].to_numpy(dtype='float64')) for sym in priced]
+        ).sort('date')
+        daily = daily.join_asof(prices, on='date')
+
+    def column(name):
+        return pl.col(name).fill_null(0.0) if name in daily.columns else pl.lit(0.0)
+
+    symbol_columns = []
+    for sym in all_symbols:
+        shares = column(f'{sym}_shares')
+        if sym in priced:
+            price = pl.col(f'{sym}_price')
+            value = pl.when((shares > 0) & price.is_not_null()).then(shares * price).otherwise(0.0)
+        else:
+            value = pl.lit(0.0)
+        symbol_columns += [shares.alias(f'{sym}_shares'), value.alias(f'{sym}_value')]
+
+    daily = daily.select(
+        'date', 'contributed', 'jpy_cash', 'usd_cash', 'dividends', 'fx_rate',
+        column('realized_pnl').alias('realized_pnl'),
+        _running_sum([column(f'{sym}_cost') for sym in cost_order]).alias('invested_capital'),
+        *symbol_columns
+    )
+    # Summed in all_symbols order, as the per-day loop did
+    daily = daily.with_columns(
+        _running_sum([pl.col(f'{sym}_value') for sym in all_symbols]).alias('holdings_value')
+    )
+
+    # Contributed capital includes USD from FX + current value of unconverted JPY
+    total_cash = (pl.col('jpy_cash') / pl.col('fx_rate')) + pl.col('usd_cash')
+    total_contributed = pl.col('contributed') + (pl.col('jpy_cash') / pl.col('fx_rate'))
+    equity = total_cash + pl.col('holdings_value')
+    unrealized_pnl = pl.col('holdings_value') - pl.col('invested_capital')
+
+    return daily.select(
+        'date',
+        *[f'{sym}_{kind}' for sym in all_symbols for kind in ('shares', 'value')],
+        total_contributed.alias('contributed'),
+        'invested_capital',
+        total_cash.alias('cash'),
+        equity.alias('equity'),
+        'holdings_value',
+        unrealized_pnl.alias('unrealized_pnl'),
+        'realized_pnl',
+        (unrealized_pnl + pl.col('realized_pnl')).alias('total_investment_pnl'),
+        (equity - total_contributed).alias('portfolio_pnl'),
+        pl.when(total_contributed > 0).then((equity / total_contributed - 1) * 100).otherwise(0.0).alias('return_pct'),
+        'dividends'
+    )
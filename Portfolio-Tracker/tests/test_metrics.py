@@ -0,0 +1,216 @@
+"""
+Regression tests for calculate_portfolio_metrics against the original day-by-day loop.
+"""
+
+import os
+import sys
+import types
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+# Prices are patched in per test, so the suite runs without yfinance installed
+try:
+    import yfinance  # noqa: F401
+except ImportError:
+    sys.modules['yfinance'] = types.ModuleType('yfinance')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import metrics  # noqa: E402
+
+TODAY = date.today()
+SCHEMA = {'date': pl.Date, 'type': pl.String, 'symbol': pl.String, 'quantity': pl.Float64,
+          'amount': pl.Float64, 'commission': pl.Float64, 'currency': pl.String}
+
+
+def reference_metrics(transactions, price_data, all_symbols):
+    """
+    The per-day loop calculate_portfolio_metrics replaced, with prices and symbol order passed in.
+    """
+    first_fx = transactions.filter((pl.col('type') == 'FX') & (pl.col('symbol') == 'USD.JPY') & (pl.col('quantity') != 0))
+    current_fx_rate = abs(first_fx[0, 'amount']) / abs(first_fx[0, 'quantity'])
+    contributed = jpy_cash = usd_cash = dividends = realized_pnl = 0.0
+    holdings, current_holdings_cost, daily_values = {}, {}, []
+
+    current = transactions['date'].min()
+    while current <= TODAY:
+        for row in transactions.filter(pl.col('date') == current).iter_rows(named=True):
+            if row['type'] == 'Deposit':
+                if row['currency'] == 'JPY':
+                    jpy_cash += row['amount']
+                else:
+                    usd_cash += row['amount']
+                    contributed += row['amount']
+            elif row['type'] == 'FX':
+                contributed += row['quantity']
+                usd_cash += row['quantity']
+                jpy_cash += row['amount']
+                if row['quantity'] != 0:
+                    current_fx_rate = abs(row['amount']) / abs(row['quantity'])
+            elif row['type'] == 'Trade' and row['symbol']:
+                sym, qty = row['symbol'], row['quantity']
+                cost = abs(row['amount']) + abs(row['commission'])
+                usd_cash += row['amount'] - row['commission']
+                if qty > 0:
+                    current_holdings_cost[sym] = current_holdings_cost.get(sym, 0) + cost
+                elif sym in current_holdings_cost and holdings.get(sym, 0) > 0:
+                    sold_cost = (current_holdings_cost[sym] / holdings[sym]) * abs(qty)
+                    realized_pnl += (row['amount'] - row['commission']) - sold_cost
+                    current_holdings_cost[sym] -= sold_cost
+                holdings[sym] = holdings.get(sym, 0) + qty
+                if holdings[sym] == 0:
+                    holdings.pop(sym, None)
+            elif row['type'] == 'Dividend':
+                usd_cash += row['amount']
+                dividends += row['amount']
+            elif row['type'] in ['Tax', 'Fee']:
+                usd_cash += row['amount']
+
+        holdings_value = 0.0
+        day_data = {'date': current}
+        for sym in all_symbols:
+            shares = holdings.get(sym, 0)
+            sym_value = 0.0
+            if shares > 0 and sym in price_data.columns:
+                prices = price_data.loc[:str(current), sym]
+                if len(prices) > 0:
+                    sym_value = shares * prices.iloc[-1]
+                    holdings_value += sym_value
+            day_data[f'{sym}_shares'] = float(shares)
+            day_data[f'{sym}_value'] = sym_value
+
+        total_cash = (jpy_cash / current_fx_rate) + usd_cash
+        invested_capital = sum(current_holdings_cost.values())
+        unrealized_pnl = holdings_value - invested_capital
+        equity = total_cash + holdings_value
+        total_contributed = contributed + (jpy_cash / current_fx_rate)
+        day_data.update({
+            'contributed': total_contributed, 'invested_capital': float(invested_capital),
+            'cash': total_cash, 'equity': equity, 'holdings_value': holdings_value,
+            'unrealized_pnl': unrealized_pnl, 'realized_pnl': realized_pnl,
+            'total_investment_pnl': unrealized_pnl + realized_pnl,
+            'portfolio_pnl': equity - total_contributed,
+            'return_pct': ((equity / total_contributed - 1) * 100) if total_contributed > 0 else 0.0,
+            'dividends': dividends
+        })
+        daily_values.append(day_data)
+        current += timedelta(days=1)
+
+    return pl.DataFrame(daily_values, infer_schema_length=None)
+
+
+def ledger(rows):
+    """
+    Transactions frame shaped like load_transactions(), from (days_ago, type, symbol, quantity, amount, commission, currency).
+    """
+    return pl.DataFrame(
+        [dict(zip(SCHEMA, (TODAY - timedelta(days=r[0]), *r[1:]))) for r in rows], schema=SCHEMA
+    ).sort('date')
+
+
+def close_prices(start_days_ago, closes):
+    """
+    Business-day close matrix starting start_days_ago, as yfinance returns it.
+    """
+    index = pd.bdate_range(TODAY - timedelta(days=start_days_ago), TODAY - timedelta(days=1))
+    return pd.DataFrame({sym: np.resize(np.asarray(values, dtype=float), len(index)) for sym, values in closes.items()},
+                        index=index)
+
+
+def assert_matches_reference(monkeypatch, transactions, price_data):
+    def download(symbols, start=None, end=None, progress=False, auto_adjust=True):
+        closes = price_data[[sym for sym in symbols if sym in price_data.columns]]
+        if len(symbols) == 1:
+            return closes.rename(columns={symbols[0]: 'Close'})
+        return pd.concat({'Close': closes}, axis=1)
+
+    monkeypatch.setattr(metrics.yf, 'download', download, raising=False)
+    result = metrics.calculate_portfolio_metrics(transactions)
+    symbols = transactions.filter(pl.col('type') == 'Trade')['symbol'].unique(maintain_order=True).to_list()
+    assert_frame_equal(result, reference_metrics(transactions, price_data, symbols), check_exact=True)
+    return result
+
+
+FUNDING = [
+    (60, 'Deposit', None, 0.0, 1_000_000.0, 0.0, 'JPY'),
+    (59, 'FX', 'USD.JPY', 6_500.0, -1_000_000.0, 0.0, 'JPY'),
+]
+
+
+def test_buys_sells_and_dividends(monkeypatch):
+    transactions = ledger(FUNDING + [
+        (55, 'Trade', 'AAA', 10.0, -1_000.0, 1.0, 'USD'),
+        (50, 'Trade', 'BBB', 5.0, -750.5, 0.5, 'USD'),
+        (40, 'Trade', 'AAA', 4.0, -440.0, 1.0, 'USD'),
+        (30, 'Trade', 'AAA', -6.0, 690.0, 1.0, 'USD'),
+        (30, 'Dividend', 'BBB', 0.0, 12.3, 0.0, 'USD'),
+        (30, 'Tax', 'BBB', 0.0, -1.23, 0.0, 'USD'),
+        (20, 'Trade', 'BBB', -5.0, 800.0, 0.5, 'USD'),
+        (10, 'Fee', None, 0.0, -2.0, 0.0, 'USD'),
+    ])
+    prices = close_prices(70, {'AAA': [100.0, 101.5, 99.25, 103.0], 'BBB': [150.0, 152.0, 149.5]})
+    result = assert_matches_reference(monkeypatch, transactions, prices)
+    assert result['realized_pnl'][-1] != 0
+    assert result['BBB_shares'][-1] == 0
+
+
+def test_no_buys(monkeypatch):
+    # Sell-only and zero-quantity trades never open a cost basis
+    transactions = ledger(FUNDING + [
+        (50, 'Trade', 'AAA', -3.0, 300.0, 1.0, 'USD'),
+        (40, 'Trade', 'BBB', 0.0, 0.0, 1.0, 'USD'),
+    ])
+    prices = close_prices(70, {'AAA': [100.0], 'BBB': [50.0]})
+    result = assert_matches_reference(monkeypatch, transactions, prices)
+    assert (result['invested_capital'] == 0).all()
+
+
+def test_buys_after_today(monkeypatch):
+    transactions = ledger(FUNDING + [(-5, 'Trade', 'AAA', 2.0, -200.0, 1.0, 'USD')])
+    result = assert_matches_reference(monkeypatch, transactions, close_prices(70, {'AAA': [100.0]}))
+    assert (result['AAA_shares'] == 0).all()
+
+
+def test_short_sale_before_buy(monkeypatch):
+    transactions = ledger(FUNDING + [
+        (50, 'Trade', 'AAA', -2.0, 210.0, 1.0, 'USD'),
+        (40, 'Trade', 'AAA', 5.0, -500.0, 1.0, 'USD'),
+        (30, 'Trade', 'AAA', -1.0, 105.0, 1.0, 'USD'),
+    ])
+    assert_matches_reference(monkeypatch, transactions, close_prices(70, {'AAA': [100.0, 104.0]}))
+
+
+def test_nan_closes(monkeypatch):
+    # BBB has gaps in its closes; CCC is only quoted from 20 days ago, after it was bought
+    transactions = ledger(FUNDING + [
+        (55, 'Trade', 'BBB', 5.0, -500.0, 1.0, 'USD'),
+        (45, 'Trade', 'CCC', 3.0, -90.0, 1.0, 'USD'),
+    ])
+    prices = close_prices(70, {'BBB': [100.0, np.nan, 102.0, 101.0, np.nan], 'CCC': [30.0, 31.0]})
+    prices.loc[:str(TODAY - timedelta(days=20)), 'CCC'] = np.nan
+    result = assert_matches_reference(monkeypatch, transactions, prices)
+    assert result['holdings_value'].is_nan().any()
+
+
+def test_prices_start_after_first_trade(monkeypatch):
+    transactions = ledger(FUNDING + [(40, 'Trade', 'AAA', 4.0, -400.0, 1.0, 'USD')])
+    result = assert_matches_reference(monkeypatch, transactions, close_prices(20, {'AAA': [100.0, 101.0]}))
+    assert result.filter(pl.col('date') < TODAY - timedelta(days=20))['AAA_value'].eq(0).all()
+    assert result['AAA_value'][-1] > 0
+
+
+def test_jpy_only_deposits(monkeypatch):
+    # JPY waits unconverted at the first FX rate, later conversions move the rate
+    transactions = ledger([
+        (60, 'Deposit', None, 0.0, 500_000.0, 0.0, 'JPY'),
+        (45, 'FX', 'USD.JPY', 3_300.0, -500_000.0, 0.0, 'JPY'),
+        (40, 'Deposit', None, 0.0, 300_000.0, 0.0, 'JPY'),
+        (35, 'Trade', 'AAA', 10.0, -1_000.0, 1.0, 'USD'),
+        (25, 'FX', 'USD.JPY', 2_000.0, -300_000.0, 0.0, 'JPY'),
+    ])
+    result = assert_matches_reference(monkeypatch, transactions, close_prices(70, {'AAA': [100.0, 98.0]}))
+    assert result['contributed'][0] > 0